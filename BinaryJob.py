@@ -0,0 +1,128 @@
+import numpy as np
+
+# A job file is one fixed-size header followed by count fixed-width records
+JOB_MAGIC = b'GALVOJOB'
+JOB_VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('mode', 'S8'), ('count', '<u8'),
+                         ('img_width', '<f8'), ('img_height', '<f8'), ('reserved', 'V20')])
+# One point of the job: position in output units and laser power (0 = laser off)
+RECORD_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('power', 'u1')])
+# The same point in memory; positions stay float64 like GcodeParser's and are only
+# narrowed to RECORD_DTYPE when written to a file
+MEMORY_RECORD_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('power', 'u1')])
+
+
+def _record_extent(mode, records):
+    # Largest x and y of the records, following GcodeParser: raster jobs only count laser-on points
+    if mode == "raster":
+        records = records[records['power'] > 0]
+    if not len(records):
+        return 0.0, 0.0
+    return float(records['x'].max()), float(records['y'].max())
+
+
+class JobRecords:
+
+    def __init__(self, mode, scale=1.0):
+        # In-memory job: collects record blocks and offers the GcodeParser getters
+        self.mode = mode
+        self.scale = scale
+        self.frames = []
+        self.records = np.empty(0, dtype=MEMORY_RECORD_DTYPE)
+        self.img_width = 0.0
+        self.img_height = 0.0
+        self._blocks = []
+
+    def write(self, records):
+        self._blocks.append(np.asarray(records, dtype=MEMORY_RECORD_DTYPE))
+        width, height = _record_extent(self.mode, records)
+        self.img_width = max(self.img_width, width)
+        self.img_height = max(self.img_height, height)
+
+    def close(self):
+        if self._blocks:
+            self.records = np.concatenate([self.records] + self._blocks)
+        self._blocks = []
+
+    def _coords(self, field):
+        # Vector and span jobs expose every point; raster jobs only the laser-on points, like GcodeParser
+        coords = self.records[field]
+        if self.mode == "raster":
+            coords = coords[self.records['power'] > 0]
+        if self.scale != 1.0:
+            coords = coords * self.scale
+        return coords
+
+    def get_frames(self):
+        return self.frames
+
+    def get_x_coords(self):
+        return self._coords('x')
+
+    def get_y_coords(self):
+        return self._coords('y')
+
+    def get_laser_state(self):
+        # Laser on (power above 0) for every record, laser-off moves included, like GcodeParser
+        return self.records['power'] > 0
+
+    def get_power(self):
+        # Power of every record, laser-off moves included
+        return self.records['power']
+
+    def get_image_dimensions(self):
+        return self.img_width, self.img_height
+
+
+class BinaryJobWriter:
+
+    def __init__(self, job_file_path, mode):
+        self.job_file_path = job_file_path
+        self.mode = mode
+        self.count = 0
+        self.img_width = 0.0
+        self.img_height = 0.0
+        self.file = open(job_file_path, 'wb')
+        # Placeholder header, rewritten with the final count on close
+        self.file.write(np.zeros(1, dtype=HEADER_DTYPE).tobytes())
+
+    def write(self, records):
+        records = np.ascontiguousarray(records, dtype=RECORD_DTYPE)
+        self.file.write(records.tobytes())
+        self.count += len(records)
+        width, height = _record_extent(self.mode, records)
+        self.img_width = max(self.img_width, width)
+        self.img_height = max(self.img_height, height)
+
+    def close(self):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = JOB_MAGIC
+        header['version'] = JOB_VERSION
+        header['mode'] = self.mode.encode('ascii')
+        header['count'] = self.count
+        header['img_width'] = self.img_width
+        header['img_height'] = self.img_height
+        self.file.seek(0)
+        self.file.write(header.tobytes())
+        self.file.close()
+
+
+class BinaryJobParser(JobRecords):
+
+    def __init__(self, job_file_path, scale=1.0):
+        self.job_file_path = job_file_path
+
+        header = np.fromfile(job_file_path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header['magic'][0] != JOB_MAGIC:
+            raise ValueError(f"{job_file_path} is not a binary galvo job.")
+        if header['version'][0] != JOB_VERSION:
+            raise ValueError(f"Unsupported binary job version {header['version'][0]}.")
+        super().__init__(header['mode'][0].decode('ascii'), scale)
+        self.img_width = float(header['img_width'][0])
+        self.img_height = float(header['img_height'][0])
+
+        # Records stay on disk and are paged in on access
+        count = int(header['count'][0])
+        if count:
+            self.records = np.memmap(job_file_path, dtype=RECORD_DTYPE, mode='r',
+                                     offset=HEADER_DTYPE.itemsize, shape=(count,))
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from BinaryJob import JobRecords
+
+# Bump when the conversion output changes so stale entries stop matching
+CACHE_VERSION = 5
+# ImageToGcode settings that change the conversion output
+KEY_FIELDS = ("downsample_factor", "raster_direction", "mode", "scale", "threshold", "invert", "scale_mode",
+              "tone_mode", "optimize_travel", "simplify_tolerance", "curve_fit")
+# Converter results besides the output itself, kept in a small .meta file next to each entry
+META_FIELDS = ("jump_length_before", "jump_length_after")
+
+
+class ConversionCache:
+
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        # On-disk cache of ImageToGcode results keyed by image content and settings,
+        # evicting least recently used entries once it grows past max_bytes
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, converter):
+        digest = hashlib.sha256()
+        with open(converter.image_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        # Output files are cached as is; in-memory jobs keep their float64 records
+        kind = "memory" if converter.output_file is None else converter.output_format
+        settings = [CACHE_VERSION, kind] + [getattr(converter, field) for field in KEY_FIELDS]
+        digest.update(repr(settings).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".entry")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, key + ".meta")
+
+    def fetch(self, key, converter):
+        # Fill in the converter's output from the cache; returns False on a miss
+        entry = self._entry_path(key)
+        if not os.path.exists(entry):
+            self.misses += 1
+            return False
+
+        if converter.output_file is None:
+            with np.load(entry, allow_pickle=False) as cached:
+                converter.job = JobRecords(str(cached['mode']))
+                converter.job.write(cached['records'])
+            converter.job.close()
+        else:
+            shutil.copyfile(entry, converter.output_file)
+        try:
+            with open(self._meta_path(key)) as f:
+                for field, value in json.load(f).items():
+                    setattr(converter, field, value)
+        except (OSError, ValueError):
+            pass
+
+        # Touching the entry marks it as recently used
+        os.utime(entry)
+        self.hits += 1
+        return True
+
+    def store(self, key, converter):
+        # Add the converter's finished output to the cache
+        entry = self._entry_path(key)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        if converter.output_file is None:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, mode=converter.job.mode, records=converter.job.records)
+        elif os.path.exists(converter.output_file):
+            shutil.copyfile(converter.output_file, temp_path)
+        else:
+            os.remove(temp_path)
+            return
+        # An entry that cannot fit would only evict everything else and then itself
+        if os.path.getsize(temp_path) > self.max_bytes:
+            os.remove(temp_path)
+            return
+        with open(self._meta_path(key), 'w') as f:
+            json.dump({field: getattr(converter, field) for field in META_FIELDS}, f)
+        os.replace(temp_path, entry)
+        self._evict(keep=os.path.basename(entry))
+
+    def _evict(self, keep=None):
+        # Removes least recently used entries until the cache fits; keep is never removed
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".entry") and name != keep:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        if keep is not None:
+            total += os.path.getsize(os.path.join(self.cache_dir, keep))
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            meta = os.path.join(self.cache_dir, name[:-len(".entry")] + ".meta")
+            if os.path.exists(meta):
+                os.remove(meta)
+            total -= size
+            self.evictions += 1
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,175 @@
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+
+# Bump when the saved grid layout changes
+CORRECTION_VERSION = 1
+# Points converted per pass; small passes keep the temporaries of the interpolation in cache
+CHUNK_POINTS = 1 << 14
+# Polynomial coefficients (constant term first) of one grid cell from the samples around it:
+# the two corners for bilinear, the four samples of a Catmull-Rom spline for bicubic
+CELL_MATRICES = {
+    "bilinear": np.array([[1.0, 0.0], [-1.0, 1.0]]),
+    "bicubic": 0.5 * np.array([[0.0, 2.0, 0.0, 0.0], [-1.0, 0.0, 1.0, 0.0],
+                               [2.0, -5.0, 4.0, -1.0], [-1.0, 3.0, -3.0, 1.0]]),
+}
+
+
+def _cell_coefficients(values, method):
+    # Coefficients a[j, i] of value = sum a[j, i] * v**j * u**i in every cell of the grid,
+    # shape (k, k, cells) with cells numbered row by row. Bicubic cells on the border take
+    # their outer samples from a linear continuation of the grid.
+    matrix = CELL_MATRICES[method]
+    k = len(matrix)
+    if k == 4:
+        values = np.concatenate((2 * values[:1] - values[1:2], values, 2 * values[-1:] - values[-2:-1]), axis=0)
+        values = np.concatenate((2 * values[:, :1] - values[:, 1:2], values,
+                                 2 * values[:, -1:] - values[:, -2:-1]), axis=1)
+    windows = np.lib.stride_tricks.sliding_window_view(values, (k, k))
+    coefficients = np.einsum('ab,yxbc,dc->adyx', matrix, windows, matrix)
+    return np.ascontiguousarray(coefficients.reshape(k, k, -1))
+
+
+def _read_pattern(pattern_file_path):
+    # Rows of 'dac_x dac_y x_mm y_mm', separated by spaces, tabs or commas; '#' starts a comment
+    rows = []
+    with open(pattern_file_path) as f:
+        for line in f:
+            fields = line.split('#')[0].replace(',', ' ').split()
+            if fields:
+                rows.append(fields)
+    try:
+        pattern = np.array(rows, dtype=np.float64)
+    except ValueError:
+        raise ValueError(f"{pattern_file_path} is not a test pattern: every row needs 4 numbers.") from None
+    if pattern.ndim != 2 or pattern.shape[1] != 4:
+        raise ValueError(f"{pattern_file_path} is not a test pattern: every row needs 4 numbers.")
+    return pattern
+
+
+def test_pattern_codes(nodes=9, dac_res=4096, margin=0.1):
+    # DAC codes of a nodes x nodes test pattern spanning the DAC range less a margin on each
+    # side. Mark them, measure where each spot landed and list 'dac_x dac_y x_mm y_mm' per spot
+    # for FieldCorrection.fit.
+    codes = np.rint(np.linspace(margin * dac_res, (1 - margin) * dac_res, nodes))
+    dac_x, dac_y = np.meshgrid(codes, codes)
+    return dac_x.ravel(), dac_y.ravel()
+
+
+class FieldCorrection:
+
+    def __init__(self, x_nodes, y_nodes, dac_x, dac_y, method="bilinear"):
+        # Correction grid: DAC codes that put the beam on every node of a regular grid of target
+        # positions in mm. x_nodes and y_nodes are evenly spaced and increasing; dac_x and dac_y
+        # have one row per y node. Positions in between are interpolated bilinearly or with
+        # bicubic Catmull-Rom splines, and positions outside from the border cells.
+        self.x_nodes = np.asarray(x_nodes, dtype=np.float64)
+        self.y_nodes = np.asarray(y_nodes, dtype=np.float64)
+        self.dac_x = np.asarray(dac_x, dtype=np.float64)
+        self.dac_y = np.asarray(dac_y, dtype=np.float64)
+        self.method = method.lower().strip()
+
+        if self.method not in CELL_MATRICES:
+            raise ValueError("Unsupported interpolation method. Use 'bilinear' or 'bicubic'.")
+        shape = (len(self.y_nodes), len(self.x_nodes))
+        if min(shape) < 2 or self.dac_x.shape != shape or self.dac_y.shape != shape:
+            raise ValueError("A correction grid needs at least 2 x 2 nodes and one DAC code pair per node.")
+        for nodes in (self.x_nodes, self.y_nodes):
+            steps = np.diff(nodes)
+            if steps[0] <= 0 or not np.allclose(steps, steps[0]):
+                raise ValueError("Correction grid nodes must be evenly spaced and increasing.")
+
+        self._coefficients = [_cell_coefficients(values, self.method) for values in (self.dac_x, self.dac_y)]
+
+    @classmethod
+    def from_function(cls, to_dac, extent, nodes=33, method="bilinear"):
+        # Grid sampled from to_dac(x, y) -> (dac_x, dac_y) over extent (x_min, x_max, y_min, y_max)
+        # in mm, e.g. the uncorrected LaserPathPlanning transform as a starting point
+        x_nodes = np.linspace(extent[0], extent[1], nodes)
+        y_nodes = np.linspace(extent[2], extent[3], nodes)
+        x, y = np.meshgrid(x_nodes, y_nodes)
+        dac_x, dac_y = to_dac(x.ravel(), y.ravel())
+        return cls(x_nodes, y_nodes, np.reshape(dac_x, x.shape), np.reshape(dac_y, x.shape), method)
+
+    @classmethod
+    def fit(cls, pattern_file_path, nodes=33, extent=None, smoothing=0.0, method="bilinear"):
+        # Grid fitted to a measured test pattern (see test_pattern_codes): a thin-plate spline
+        # from measured position to DAC code, sampled on nodes x nodes positions over extent
+        # (x_min, x_max, y_min, y_max) in mm, by default the measured area. A positive
+        # smoothing lets the fit pass near rather than through noisy measurements.
+        pattern = _read_pattern(pattern_file_path)
+        if len(pattern) < 4:
+            raise ValueError("Fitting a correction grid needs at least 4 measured points.")
+        measured, codes = pattern[:, 2:], pattern[:, :2]
+        if extent is None:
+            extent = (measured[:, 0].min(), measured[:, 0].max(), measured[:, 1].min(), measured[:, 1].max())
+        try:
+            model = RBFInterpolator(measured, codes, kernel='thin_plate_spline', smoothing=smoothing, degree=1)
+        except np.linalg.LinAlgError:
+            raise ValueError("Cannot fit a correction grid: measured points repeat or lie on one line.") from None
+        return cls.from_function(lambda x, y: model(np.column_stack((x, y))).T, extent, nodes, method)
+
+    @classmethod
+    def load(cls, correction_file_path, method="bilinear"):
+        with np.load(correction_file_path, allow_pickle=False) as grid:
+            if 'version' not in grid or 'dac_x' not in grid:
+                raise ValueError(f"{correction_file_path} is not a field correction grid.")
+            if int(grid['version']) != CORRECTION_VERSION:
+                raise ValueError(f"Unsupported field correction version {int(grid['version'])}.")
+            return cls(grid['x_nodes'], grid['y_nodes'], grid['dac_x'], grid['dac_y'], method)
+
+    def save(self, correction_file_path):
+        with open(correction_file_path, 'wb') as f:
+            np.savez(f, version=CORRECTION_VERSION, x_nodes=self.x_nodes, y_nodes=self.y_nodes,
+                     dac_x=self.dac_x, dac_y=self.dac_y)
+
+    def apply(self, x_coords, y_coords):
+        # DAC codes (float64) for every target position in mm, chunk by chunk with the cell
+        # polynomials evaluated in Horner form
+        x_coords = np.asarray(x_coords, dtype=np.float64).ravel()
+        y_coords = np.asarray(y_coords, dtype=np.float64).ravel()
+        if len(x_coords) != len(y_coords):
+            raise ValueError("x_coords and y_coords must have the same length.")
+        count = len(x_coords)
+        dac_x, dac_y = np.empty(count), np.empty(count)
+
+        columns, rows = len(self.x_nodes) - 1, len(self.y_nodes) - 1
+        x_scale = columns / (self.x_nodes[-1] - self.x_nodes[0])
+        y_scale = rows / (self.y_nodes[-1] - self.y_nodes[0])
+        size = max(min(CHUNK_POINTS, count), 1)
+        u, v, clipped = np.empty(size), np.empty(size), np.empty(size)
+        term, coefficient = np.empty(size), np.empty(size)
+        column, cell = np.empty(size, dtype=np.intp), np.empty(size, dtype=np.intp)
+        for start in range(0, count, size):
+            end = min(start + size, count)
+            n = end - start
+            # Position within the cell as a fraction of it, outside [0, 1] beyond the border cells
+            for coords, offset, scale, last, fraction, index in (
+                    (x_coords, self.x_nodes[0], x_scale, columns - 1, u[:n], column[:n]),
+                    (y_coords, self.y_nodes[0], y_scale, rows - 1, v[:n], cell[:n])):
+                np.subtract(coords[start:end], offset, out=fraction)
+                fraction *= scale
+                np.clip(fraction, 0, last, out=clipped[:n])
+                index[...] = clipped[:n]
+                fraction -= index
+            cell[:n] *= columns
+            cell[:n] += column[:n]
+
+            for coefficients, out in zip(self._coefficients, (dac_x[start:end], dac_y[start:end])):
+                self._evaluate(coefficients, cell[:n], u[:n], v[:n], out, term[:n], coefficient[:n])
+        return dac_x, dac_y
+
+    @staticmethod
+    def _evaluate(coefficients, cell, u, v, out, term, coefficient):
+        # out = sum a[j, i] * v**j * u**i over the cell coefficients, rows in u nested in v.
+        # Cell numbers are always in range; mode='clip' lets take write straight into the buffers.
+        k = len(coefficients)
+        for j in range(k - 1, -1, -1):
+            row = coefficients[j]
+            target = out if j == k - 1 else term
+            np.take(row[k - 1], cell, out=target, mode='clip')
+            for i in range(k - 2, -1, -1):
+                target *= u
+                target += np.take(row[i], cell, out=coefficient, mode='clip')
+            if j < k - 1:
+                out *= v
+                out += term
@@ -1,122 +1,923 @@
-from tqdm import tqdm  # Import tqdm library
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
-class GcodeParser:
-    def __init__(self, gcode_file_path, scale=1.0):
+import numpy as np
+
+# Spaces around the file contents in the parse buffer, so every token follows whitespace
+# and the 16 bytes from the start of any token stay inside the buffer
+BUFFER_PADDING = 16
+# Bytes of the file parsed at a time
+BLOCK_SIZE = 1 << 18
+# One move (or chord end of an arc): position in mm, laser state, S power and feed rate in
+# mm/min in effect (0 before the first F word) and the G code that made it (0-3). Interpreted
+# moves are kept as one contiguous array per field with these types, and iter_chunks() joins
+# them into records.
+CHUNK_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('laser_on', '?'), ('power', '<u2'), ('feed', '<f4'),
+                        ('move_type', 'u1')])
+# First word of a header line naming the job mode
+HEADER_PATTERN = re.compile(rb'[\r\n][ \t\f\v\x1c-\x1f]*(raster|span|vector)(?=\s)', re.IGNORECASE)
+# G codes of straight and arc moves, and of other commands whose X/Y words are not a move
+MOTION_CODES = (0, 1, 2, 3)
+NON_MOTION_CODES = (4, 10, 28, 30, 92)
+# Clockwise (G2) and counterclockwise (G3) arcs in the XY plane
+ARC_CODES = (2, 3)
+# Default largest distance in output units between an arc and the chords replacing it; pass
+# LaserPathPlanning.dac_steps_to_mm(0.5, laser_distance, dac_res) to stop at half a DAC step
+ARC_TOLERANCE = 0.01
+# Sweeps this close to zero (radians) make a full circle, as the end lies on the start
+ARC_ANGULAR_EPSILON = 5e-7
+# M codes switching the laser on (M3, M4) and off (M5)
+LASER_CODES = (3, 4, 5)
+MM_PER_INCH = 25.4
+# Feed rate in mm/min assumed for moves before the first F word, as in gcodeparserclass
+DEFAULT_FEED = 1500.0
+# Move columns needed for the coordinates of a job: raster jobs keep only laser-on moves
+COORDINATE_FIELDS = ('x', 'y', 'laser_on')
+# Move columns get_stats reduces: positions, laser state and the feed rates of marks
+STATS_FIELDS = ('x', 'y', 'laser_on', 'move_type', 'feed')
+# ModalState fields whose use is tracked when byte ranges are interpreted on their own
+TRACKED_FIELDS = ('motion', 'absolute', 'inches', 'laser_on', 'power', 'feed', 'x', 'y')
+# Bump when the interpreted moves change so stale sidecars stop matching
+SIDECAR_VERSION = 7
+# Files up to SIDECAR_SAMPLES * SIDECAR_SAMPLE_SIZE bytes are hashed whole, larger ones
+# through that many evenly spaced samples
+SIDECAR_SAMPLES = 64
+SIDECAR_SAMPLE_SIZE = 1 << 16
+# Plain decimals of up to 15 digits take the vectorized path; they convert exactly through
+# an integer mantissa that stays below 2**53
+MAX_FAST_DIGITS = 15
+POWERS_OF_TEN = np.array([float(10 ** k) for k in range(MAX_FAST_DIGITS + 1)])
+
+
+def _parse_buffer(text):
+    # Text between BUFFER_PADDING spaces and a newline in front and BUFFER_PADDING spaces behind
+    data = np.full(len(text) + 2 * BUFFER_PADDING + 1, ord(' '), dtype=np.uint8)
+    data[BUFFER_PADDING] = ord('\n')
+    data[BUFFER_PADDING + 1:BUFFER_PADDING + 1 + len(text)] = np.frombuffer(text, dtype=np.uint8)
+    return data
+
+
+def _read_buffers(gcode_file_path, block_size=BLOCK_SIZE, start=0, end=None):
+    # Parse buffers of whole lines from bytes start to end, about block_size bytes each;
+    # small blocks keep the temporary arrays of the vectorized parse in cache
+    carry = b''
+    with open(gcode_file_path, 'rb') as file:
+        file.seek(start)
+        remaining = os.fstat(file.fileno()).st_size - start if end is None else end - start
+        while True:
+            chunk = file.read(min(block_size, remaining))
+            remaining -= len(chunk)
+            if not chunk:
+                if carry:
+                    yield _parse_buffer(carry)
+                return
+            text = carry + chunk
+            cut = max(text.rfind(b'\n'), text.rfind(b'\r')) + 1
+            if cut:
+                yield _parse_buffer(text[:cut])
+            carry = text[cut:]
+
+
+def _line_ranges(gcode_file_path, count):
+    # About count byte ranges covering the file, each starting at the beginning of a line
+    size = os.path.getsize(gcode_file_path)
+    bounds = [0]
+    with open(gcode_file_path, 'rb') as file:
+        for k in range(1, count):
+            position = max(size * k // count, bounds[-1])
+            file.seek(position)
+            while True:
+                text = file.read(1 << 16)
+                cut = min((text.find(ending) for ending in (b'\n', b'\r') if ending in text), default=-1)
+                if cut >= 0 or not text:
+                    break
+                position += len(text)
+            position = size if cut < 0 else position + cut + 1
+            if position < size:
+                bounds.append(position)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _line_text(data, position):
+    # Text of the line around a byte offset, as readlines() would return it
+    line_start = position
+    while data[line_start - 1] not in b'\r\n':
+        line_start -= 1
+    line_end = position
+    while line_end < len(data) - BUFFER_PADDING and data[line_end] not in b'\r\n':
+        line_end += 1
+    ending = "\n" if data[line_end] in b'\r\n' else ""
+    return bytes(data[line_start:line_end]).decode('utf-8', 'replace') + ending
+
+
+def _parse_floats(data, starts, ends):
+    # float() of each token text data[start:end]; returns the values and a mask of the tokens that parsed.
+    # Plain decimals (optional sign, digits, at most one point) are read place by place into an integer
+    # mantissa, which over the power of ten of its decimals rounds exactly like float(). Anything else
+    # (exponents, inf, long numbers, ...) falls back to float() token by token.
+    lead = data[starts]
+    sign = (lead == ord('-')) | (lead == ord('+'))
+    first = starts + sign
+    sizes = ends - first
+    mantissa = np.zeros(len(starts))
+    digits = np.zeros(len(starts), dtype=np.int64)
+    # Digits before the point, -1 without one
+    point_at = np.full(len(starts), -1)
+    plain = sizes <= MAX_FAST_DIGITS + 1
+    for place in range(min(int(sizes.max(initial=0)), MAX_FAST_DIGITS + 1)):
+        char = data[first + place]
+        inside = sizes > place
+        digit = char - np.uint8(ord('0'))
+        is_digit = (digit < 10) & inside
+        is_point = (char == ord('.')) & inside
+        plain &= is_digit | (is_point & (point_at < 0)) | ~inside
+        point_at = np.where(is_point, digits, point_at)
+        mantissa = np.where(is_digit, mantissa * 10 + digit, mantissa)
+        digits += is_digit
+    plain &= (digits >= 1) & (digits <= MAX_FAST_DIGITS)
+    decimals = np.where(point_at < 0, 0, digits - point_at)
+    values = mantissa / POWERS_OF_TEN[np.minimum(decimals, MAX_FAST_DIGITS)]
+    values[lead == ord('-')] *= -1
+
+    parsed = plain.copy()
+    for token in np.flatnonzero(~plain):
+        text = bytes(data[starts[token]:ends[token]]).decode('utf-8', 'replace')
+        try:
+            values[token] = float(text)
+            parsed[token] = True
+        except ValueError:
+            pass
+    return values, parsed
+
+
+def _last_per_line(lines, values):
+    # Keep the last value of every line; lines must be sorted
+    last = np.append(lines[1:] != lines[:-1], True) if len(lines) else np.zeros(0, dtype=bool)
+    if last.all():
+        return lines, values
+    return lines[last], values[last]
+
+
+def _sequential_max(values):
+    # max() of the values taken in order, which skips NaN unless it comes first
+    return values[0] if np.isnan(values[0]) else np.fmax.reduce(values)
+
+
+def _parse_codes(data, starts, ends):
+    # _parse_floats for G, M, F and S numbers, reading the usual codes of up to three digits directly
+    lengths = ends - starts
+    values = np.zeros(len(starts))
+    parsed = (lengths >= 1) & (lengths <= 3)
+    for place in range(3):
+        digit = data[starts + place] - np.uint8(ord('0'))
+        inside = lengths > place
+        parsed &= ~inside | (digit < 10)
+        values = np.where(inside, values * 10 + digit, values)
+    rest = np.flatnonzero(~parsed)
+    if len(rest):
+        values[rest], parsed[rest] = _parse_floats(data, starts[rest], ends[rest])
+    return values, parsed
+
+
+def _move_values(word_lines, values, moves, move_index):
+    # Last value of the words on every move line, and which moves have one; moves flags the
+    # move lines and move_index numbers them
+    word_moves, word_values = _last_per_line(word_lines, values)
+    keep = moves[word_moves]
+    move_count = int(move_index[-1]) + 1
+    if keep.all() and len(word_moves) == move_count:
+        # Every move has this word
+        return np.ones(move_count, dtype=bool), word_values.copy()
+    word_moves = move_index[word_moves[keep]]
+    has_value = np.zeros(move_count, dtype=bool)
+    has_value[word_moves] = True
+    move_values = np.zeros(move_count)
+    move_values[word_moves] = word_values[keep]
+    return has_value, move_values
+
+
+def _forward_fill(line_count, lines, values, initial):
+    # Value in effect on every line: the last value on or before it, else initial; lines must be sorted
+    if not len(lines):
+        return np.full(line_count, initial, dtype=values.dtype)
+    lines, values = _last_per_line(lines, values)
+    source = np.full(line_count, -1)
+    source[lines] = np.arange(len(lines))
+    np.maximum.accumulate(source, out=source)
+    return np.concatenate(([initial], values))[source + 1]
+
+
+def _words(data):
+    # Words of a parse buffer: a letter standing alone (no letter right before or after it)
+    # followed by its number text, outside ';' and '(...)' comments. Returns the uppercase
+    # letters, the spans of the number texts, the lines of the words and the number of lines.
+    # Lines end at '\n' or a lone '\r'.
+    numeric = (data - np.uint8(ord('+')) <= ord('9') - ord('+')) & (data != ord(',')) & (data != ord('/'))
+    stops = np.flatnonzero(~numeric)
+    byte = data[stops]
+    letter = byte & np.uint8(0xDF)
+    is_letter = letter - np.uint8(ord('A')) < 26
+    line_break = (byte == ord('\n')) | (byte == ord('\r'))
+    line = np.cumsum(line_break, dtype=np.int32)
+    line_count = int(line[-1]) + 1
+
+    touching = is_letter[1:] & is_letter[:-1] & (stops[1:] == stops[:-1] + 1)
+    word = is_letter.copy()
+    word[1:] &= ~touching
+    word[:-1] &= ~touching
+    if (byte == ord(';')).any() or (byte == ord('(')).any():
+        # Comments run from ';' to the end of the line and between parentheses within a line
+        line_first = np.concatenate(([0], np.flatnonzero(line_break)))[line]
+        semicolons = np.cumsum(byte == ord(';'))
+        depth = np.cumsum((byte == ord('(')).astype(np.int32) - (byte == ord(')')))
+        word &= (semicolons == semicolons[line_first]) & (depth <= depth[line_first])
+    index = np.flatnonzero(word)
+    return letter[index], stops[index] + 1, stops[index + 1], line[index], line_count
+
+
+def _axis_positions(has_value, values, absolute, initial):
+    # Position after every move along one axis: moves without a value stay in place and
+    # relative values add to the previous position one after the other
+    if has_value.all() and absolute.all():
+        return values
+    if (absolute | ~has_value).all():
+        return _forward_fill(len(has_value), np.flatnonzero(has_value), values[has_value], initial)
+    delta = np.where(has_value & ~absolute, values, 0.0)
+    resets = np.flatnonzero(has_value & absolute)
+    bases = np.concatenate(([initial], values[resets]))
+    bounds = np.concatenate(([0], resets, [len(values)]))
+    positions = np.empty(len(values))
+    for base, start, end in zip(bases, bounds[:-1], bounds[1:]):
+        positions[start:end] = np.cumsum(np.concatenate(([base], delta[start:end])))[1:]
+    return positions
+
+
+def _arc_centres(start_x, start_y, end_x, end_y, radius, clockwise):
+    # Centres of R-form arcs: a positive radius takes the arc of at most half a turn, a
+    # negative one the longer arc. A radius too short to reach the end is taken as half the chord.
+    dx, dy = end_x - start_x, end_y - start_y
+    chord = np.hypot(dx, dy)
+    height = np.sqrt(np.maximum(4 * radius * radius - chord * chord, 0.0))
+    height = np.divide(height, chord, out=np.zeros_like(chord), where=chord > 0)
+    height = np.where(clockwise == (radius > 0), -height, height)
+    return start_x + 0.5 * (dx - dy * height), start_y + 0.5 * (dy + dx * height)
+
+
+def _linearize_arcs(start_x, start_y, end_x, end_y, centre_x, centre_y, clockwise, tolerance):
+    # Points along arcs around the centres, each split into the fewest equal angle steps whose
+    # chords stay within tolerance of it; an arc ending on its start is a full circle. The radius
+    # blends from the start to the end radius and every arc ends exactly on its end point.
+    # Returns the point count of every arc and the points of all arcs one after the other.
+    start_radius = np.hypot(start_x - centre_x, start_y - centre_y)
+    end_radius = np.hypot(end_x - centre_x, end_y - centre_y)
+    start_angle = np.arctan2(start_y - centre_y, start_x - centre_x)
+    sweep = np.arctan2(end_y - centre_y, end_x - centre_x) - start_angle
+    sweep = np.where(clockwise & (sweep >= -ARC_ANGULAR_EPSILON), sweep - 2 * np.pi, sweep)
+    sweep = np.where(~clockwise & (sweep <= ARC_ANGULAR_EPSILON), sweep + 2 * np.pi, sweep)
+
+    # A chord spanning angle a lies radius * (1 - cos(a / 2)) from the arc
+    radius = np.maximum(start_radius, end_radius)
+    relative = np.divide(tolerance, radius, out=np.full_like(radius, np.inf), where=radius > 0)
+    step_angle = 2 * np.arccos(np.clip(1 - relative, -1, 1))
+    counts = np.maximum(np.ceil(np.abs(sweep) / step_angle), 1).astype(np.int64)
+
+    arc = np.repeat(np.arange(len(counts)), counts)
+    last = np.cumsum(counts) - 1
+    fraction = (np.arange(len(arc)) - np.repeat(last - counts, counts)) / counts[arc]
+    angle = start_angle[arc] + sweep[arc] * fraction
+    radius = start_radius[arc] + (end_radius - start_radius)[arc] * fraction
+    x = centre_x[arc] + radius * np.cos(angle)
+    y = centre_y[arc] + radius * np.sin(angle)
+    x[last], y[last] = end_x, end_y
+    return counts, x, y
+
+
+class ModalState:
+
+    def __init__(self):
+        # Interpreter state carried from line to line: position in mm, G90/G91, G20/G21,
+        # the active motion command (-1 before the first), M3/M5, S power, feed rate in mm/min
+        # and file mode. The laser starts on, as a file is a vector job until a header says otherwise.
+        self.x = 0.0
+        self.y = 0.0
+        self.absolute = True
+        self.inches = False
+        self.motion = -1.0
+        self.laser_on = True
+        self.power = 0.0
+        self.feed = 0.0
+        self.mode = None
+        # With reads set to {} the interpreter counts, per field, the leading moves that took
+        # the value from the starting state, until a line sets the field (see _interpret_range)
+        self.reads = None
+        self.unset = set(TRACKED_FIELDS)
+        # Warnings are printed right away, or collected here when it is a list
+        self.messages = None
+
+
+def _empty_moves():
+    return {field: np.zeros(0, dtype=CHUNK_DTYPE[field]) for field in CHUNK_DTYPE.names}
+
+
+def _join_moves(blocks):
+    # One array per field from blocks of move columns
+    if not blocks:
+        return _empty_moves()
+    return {field: np.concatenate([block[field] for block in blocks]) for field in blocks[0]}
+
+
+def _records(moves):
+    # CHUNK_DTYPE array of move columns
+    records = np.empty(len(moves['x']), dtype=CHUNK_DTYPE)
+    for field, values in moves.items():
+        records[field] = values
+    return records
+
+
+def _letter_words(data, letters, starts, ends, lines, selected, parse):
+    # Lines and values of the words of every letter in selected, parsed in one call. Returns
+    # {letter: (lines, values)} with the words that parsed, in file order, and the words that did not.
+    groups = [np.flatnonzero(letters == ord(letter)) for letter in selected]
+    words = np.concatenate(groups)
+    values, parsed = parse(data, starts[words], ends[words])
+    result = {}
+    first = 0
+    for letter, group in zip(selected, groups):
+        last = first + len(group)
+        keep = parsed[first:last]
+        result[letter] = (lines[group][keep], values[first:last][keep])
+        first = last
+    return result, np.sort(words[~parsed])
+
+
+def _interpret(data, state, tolerance, fields=CHUNK_DTYPE.names):
+    # Moves of a parse buffer as columns (see CHUNK_DTYPE) in absolute mm, starting from state and
+    # updating it to the end of the buffer. G0-G3 stay active until the next one, every line
+    # with an X or Y word moves and an omitted axis keeps its position. G2/G3 arcs with an I/J
+    # centre or R radius become chords within tolerance mm of the arc, one point per chord end.
+    # M3/M4 and M5 switch the laser. Until a header names the mode the file is read as a vector
+    # job, whose moves all mark without M3: the laser starts on, a 'vector' header switches it
+    # on and a 'raster' or 'span' header switches it off.
+    # Only the columns in fields come back, x and y always; without the power or feed column the
+    # S or F words are not read and state.power or state.feed is left as it was.
+    letters, starts, ends, lines, line_count = _words(data)
+
+    no_words = (np.zeros(0, dtype=lines.dtype), np.zeros(0))
+    command_letters = 'GM' + 'F' * ('feed' in fields) + 'S' * ('power' in fields)
+    commands, _ = _letter_words(data, letters, starts, ends, lines, command_letters, _parse_codes)
+    command_lines, codes = commands['G']
+    motion = np.isin(codes, MOTION_CODES)
+    motion_codes = _forward_fill(line_count, command_lines[motion], codes[motion], state.motion)
+    distance = (codes == 90) | (codes == 91)
+    absolute = _forward_fill(line_count, command_lines[distance], codes[distance] == 90, state.absolute)
+    units = (codes == 20) | (codes == 21)
+    inches = _forward_fill(line_count, command_lines[units], codes[units] == 20, state.inches)
+    other = np.zeros(line_count, dtype=bool)
+    other[command_lines[np.isin(codes, NON_MOTION_CODES)]] = True
+
+    m_lines, m_codes = commands['M']
+    is_switch = np.isin(m_codes, LASER_CODES)
+    switch_lines, switch_on = m_lines[is_switch], m_codes[is_switch] != 5
+    if state.mode is None:
+        header = HEADER_PATTERN.search(data.tobytes())
+        if header:
+            state.mode = header.group(1).decode('ascii').lower()
+            if state.reads is not None:
+                state.reads['header'] = True
+            before = data[:header.start(1)]
+            header_line = np.count_nonzero((before == ord('\n')) | (before == ord('\r')))
+            at = np.searchsorted(switch_lines, header_line)
+            switch_lines = np.insert(switch_lines, at, header_line)
+            switch_on = np.insert(switch_on, at, state.mode == "vector")
+    laser_on = _forward_fill(line_count, switch_lines, switch_on, state.laser_on)
+    # F words take the units of their own line
+    feed_lines, feeds = commands.get('F', no_words)
+    if 'feed' in fields:
+        feeds = np.where(inches[feed_lines], feeds * MM_PER_INCH, feeds)
+        feed = _forward_fill(line_count, feed_lines, feeds, state.feed)
+    power_lines, powers = commands.get('S', no_words)
+    if 'power' in fields:
+        power = _forward_fill(line_count, power_lines, powers, state.power)
+
+    # X and Y words; a line with an invalid one is skipped
+    axes, invalid = _letter_words(data, letters, starts, ends, lines, 'XY', _parse_floats)
+    skipped = other.copy()
+    for word in invalid:
+        message = f"Skipping line with invalid {chr(letters[word])} coordinate: {_line_text(data, starts[word])}"
+        if state.messages is None:
+            print(message)
+        else:
+            state.messages.append(message)
+        skipped[lines[word]] = True
+    # I/J centre offsets and R radii of arcs
+    arc_words = dict.fromkeys('IJR', no_words)
+    if ((letters == ord('I')) | (letters == ord('J')) | (letters == ord('R'))).any():
+        arc_words, _ = _letter_words(data, letters, starts, ends, lines, 'IJR', _parse_floats)
+
+    axis_line = np.zeros(line_count, dtype=bool)
+    axis_line[axes['X'][0]] = True
+    axis_line[axes['Y'][0]] = True
+    axis_line &= ~skipped
+    # An arc with a centre but no X/Y word is a full circle
+    centre_line = np.zeros(line_count, dtype=bool)
+    centre_line[arc_words['I'][0]] = True
+    centre_line[arc_words['J'][0]] = True
+    centre_line &= ~skipped
+    moves = axis_line.copy()
+    if centre_line.any():
+        moves |= centre_line & np.isin(motion_codes, ARC_CODES)
+    moves &= motion_codes >= 0
+    move_lines = np.flatnonzero(moves)
+    block = {}
+    if 'laser_on' in fields:
+        block['laser_on'] = laser_on[move_lines]
+    if 'power' in fields:
+        block['power'] = np.clip(np.rint(power[move_lines]), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+    if 'feed' in fields:
+        block['feed'] = feed[move_lines].astype(np.float32)
+    move_types = motion_codes[move_lines].astype(np.uint8)
+    if 'move_type' in fields:
+        block['move_type'] = move_types
+    move_absolute = absolute[move_lines]
+    move_inches = inches[move_lines]
+    move_index = np.cumsum(moves) - 1
+    if state.reads is not None:
+        # Leading moves (or, for the motion command, lines with X/Y words) that use the
+        # starting value of each field, and whether the buffer sets the field
+        def uses_before(set_lines, targets=move_lines):
+            first = set_lines[0] if len(set_lines) else line_count
+            return int(np.searchsorted(targets, first)), first < line_count
+
+        uses = {'motion': uses_before(command_lines[motion], np.flatnonzero(axis_line)),
+                'absolute': uses_before(command_lines[distance]),
+                'inches': uses_before(command_lines[units]),
+                'laser_on': uses_before(switch_lines),
+                'power': uses_before(power_lines),
+                'feed': uses_before(feed_lines)}
+        if 'inches' in state.unset and uses_before(command_lines[units], feed_lines)[0]:
+            # F words converted with the starting units
+            state.reads['feed_units'] = True
+        if 'motion' in state.unset and uses_before(command_lines[motion], np.flatnonzero(centre_line))[0]:
+            # Lines with a centre that would be full circles under a starting G2/G3
+            state.reads['arc_words'] = True
+    start_x, start_y = state.x, state.y
+    for field, letter in (('x', 'X'), ('y', 'Y')):
+        has_value, move_values = _move_values(*axes[letter], moves, move_index)
+        if move_inches.any():
+            move_values[move_inches] *= MM_PER_INCH
+        block[field] = _axis_positions(has_value, move_values, move_absolute, getattr(state, field))
+        if state.reads is not None:
+            setting = np.flatnonzero(has_value & move_absolute)
+            first = setting[0] if len(setting) else len(move_lines)
+            uses[field] = (first, first < len(move_lines))
+            if field in state.unset and (has_value[:first] & ~move_absolute[:first]).any():
+                state.reads[field + '_relative'] = True
+        if len(move_lines):
+            setattr(state, field, float(block[field][-1]))
+
+    # Arcs with a centre or radius become chords from the end of the move before them
+    arcs = np.zeros(0, dtype=np.int64)
+    if any(len(word_lines) for word_lines, _ in arc_words.values()) and len(move_lines):
+        centre = {}
+        for letter in 'IJR':
+            has_value, move_values = _move_values(*arc_words[letter], moves, move_index)
+            if move_inches.any():
+                move_values[move_inches] *= MM_PER_INCH
+            centre[letter] = (has_value, move_values)
+        has_centre = centre['I'][0] | centre['J'][0]
+        arcs = np.flatnonzero(np.isin(move_types, ARC_CODES) & (has_centre | centre['R'][0]))
+    repeats = np.ones(len(move_lines), dtype=np.int64)
+    if len(arcs):
+        end_x, end_y = block['x'][arcs], block['y'][arcs]
+        arc_start_x = np.concatenate(([start_x], block['x'][:-1]))[arcs]
+        arc_start_y = np.concatenate(([start_y], block['y'][:-1]))[arcs]
+        clockwise = move_types[arcs] == 2
+        centre_x, centre_y = _arc_centres(arc_start_x, arc_start_y, end_x, end_y, centre['R'][1][arcs], clockwise)
+        by_offset = has_centre[arcs]
+        centre_x[by_offset] = (arc_start_x + centre['I'][1][arcs])[by_offset]
+        centre_y[by_offset] = (arc_start_y + centre['J'][1][arcs])[by_offset]
+        counts, x, y = _linearize_arcs(arc_start_x, arc_start_y, end_x, end_y, centre_x, centre_y,
+                                       clockwise, tolerance)
+        repeats[arcs] = counts
+        first_point = np.cumsum(repeats) - repeats
+        at = np.arange(len(x)) + np.repeat(first_point[arcs] - (np.cumsum(counts) - counts), counts)
+        block = {field: np.repeat(values, repeats) for field, values in block.items()}
+        block['x'][at] = x
+        block['y'][at] = y
+        if state.reads is not None:
+            # Arcs starting from a position that still depends on the starting state
+            first = max(uses[field][0] if field in state.unset else -1 for field in ('x', 'y'))
+            if arcs[0] <= first:
+                state.reads['arc_start'] = True
+
+    state.motion = float(motion_codes[-1])
+    state.absolute = bool(absolute[-1])
+    state.inches = bool(inches[-1])
+    state.laser_on = bool(laser_on[-1])
+    if 'power' in fields:
+        state.power = float(power[-1])
+    if 'feed' in fields:
+        state.feed = float(feed[-1])
+    if state.reads is not None:
+        # Counts of leading moves become counts of leading points
+        points_before = np.concatenate(([0], np.cumsum(repeats)))
+        for field in ('absolute', 'inches', 'laser_on', 'power', 'feed', 'x', 'y'):
+            count, sets = uses[field]
+            uses[field] = (int(points_before[count]), sets)
+        for field, (count, sets) in uses.items():
+            if field in state.unset:
+                state.reads[field] = state.reads.get(field, 0) + count
+                if sets:
+                    state.unset.discard(field)
+    return block
+
+
+def _interpret_range(gcode_file_path, start, end, motion, tolerance):
+    # Moves of one byte range interpreted on their own, from a default state with the given
+    # motion command, and the state at its end with the reads of the starting state
+    state = ModalState()
+    state.motion = motion
+    state.reads = {}
+    state.messages = []
+    blocks = [_interpret(data, state, tolerance) for data in _read_buffers(gcode_file_path, BLOCK_SIZE, start, end)]
+    return _join_moves(blocks), state
+
+
+def _header_mode(gcode_file_path):
+    # Mode named by the first header line, found the way _interpret finds it; 'vector' without one
+    for data in _read_buffers(gcode_file_path):
+        header = HEADER_PATTERN.search(data.tobytes())
+        if header:
+            return header.group(1).decode('ascii').lower()
+    return "vector"
+
+
+def _move_stats(blocks):
+    # Move and mark counts, bounding box, laser-on path length and the sum of its segment
+    # lengths over their feed rates, reduced block by block so no coordinates of the whole
+    # file are kept. Also returns the largest x and y over all moves (key False) and over
+    # laser-on moves (key True), taken the way _sequential_max takes them.
+    stats = {'moves': 0, 'marks': 0, 'mark_length': 0.0}
+    length_over_feed = 0.0
+    low = {'x': np.nan, 'y': np.nan}
+    high = {'x': np.nan, 'y': np.nan}
+    largest = {False: {}, True: {}}
+    previous = {'x': 0.0, 'y': 0.0}
+    for block in blocks:
+        if not len(block['x']):
+            continue
+        laser_on = block['laser_on']
+        # A mark runs from the previous move (the origin for the first one) to its own point
+        marks = np.flatnonzero(laser_on & (block['move_type'] != 0))
+        steps = []
+        for field in ('x', 'y'):
+            values = block[field]
+            block_high = np.fmax.reduce(values)
+            low[field] = np.fmin(low[field], np.fmin.reduce(values))
+            high[field] = np.fmax(high[field], block_high)
+            for laser_only, kept in ((False, values), (True, values[laser_on])):
+                if len(kept):
+                    kept_high = block_high if kept is values else np.fmax.reduce(kept)
+                    current = largest[laser_only].get(field)
+                    if current is None:
+                        # A NaN first value wins, as in _sequential_max
+                        largest[laser_only][field] = kept[0] if np.isnan(kept[0]) else kept_high
+                    elif not np.isnan(current):
+                        largest[laser_only][field] = np.fmax(current, kept_high)
+            if len(marks):
+                starts = values[marks - 1]
+                if marks[0] == 0:
+                    starts[0] = previous[field]
+                steps.append(values[marks] - starts)
+            previous[field] = values[-1]
+        if len(marks):
+            lengths = np.hypot(*steps)
+            feed = block['feed'][marks]
+            stats['marks'] += len(marks)
+            stats['mark_length'] += float(lengths.sum())
+            length_over_feed += float((lengths / np.where(feed > 0, feed, DEFAULT_FEED)).sum())
+        stats['moves'] += len(block['x'])
+    stats.update(min_x=float(low['x']), max_x=float(high['x']), min_y=float(low['y']), max_y=float(high['y']))
+    return stats, length_over_feed, largest
+
+
+def _file_key(gcode_file_path, tolerance):
+    # Identity of a G-code file read with an arc tolerance: path, size, modification time
+    # and a hash of its content
+    stat = os.stat(gcode_file_path)
+    digest = hashlib.sha256()
+    with open(gcode_file_path, 'rb') as file:
+        if stat.st_size <= SIDECAR_SAMPLES * SIDECAR_SAMPLE_SIZE:
+            digest.update(file.read())
+        else:
+            for offset in np.linspace(0, stat.st_size - SIDECAR_SAMPLE_SIZE, SIDECAR_SAMPLES).astype(np.int64):
+                file.seek(int(offset))
+                digest.update(file.read(SIDECAR_SAMPLE_SIZE))
+    identity = [SIDECAR_VERSION, tolerance, os.path.abspath(gcode_file_path), stat.st_size, stat.st_mtime_ns]
+    return repr(identity) + digest.hexdigest()
+
+
+class GcodeReader:
+
+    def __init__(self, gcode_file_path, scale=1.0, arc_tolerance=ARC_TOLERANCE):
+        # Streams the moves of a G-code file in fixed-size blocks without loading it whole.
+        # The mode comes from the 'raster'/'span'/'vector' header once the reader has passed it;
+        # a file without one is read as a vector job.
         self.gcode_file_path = gcode_file_path
         self.scale = scale
+        self.mode = None
+        # Largest distance in output units (scaled like the coordinates) between a G2/G3 arc
+        # and the chords it is split into; see ARC_TOLERANCE
+        self.arc_tolerance = arc_tolerance
+
+        if not arc_tolerance > 0:
+            raise ValueError("Arc tolerance must be positive.")
+
+    def _arc_tolerance_mm(self):
+        # Arcs are split in file units, before scaling
+        return self.arc_tolerance / abs(self.scale)
+
+    def _blocks(self, fields=CHUNK_DTYPE.names, messages=None):
+        # Moves of the file in absolute mm, one set of move columns per parse buffer; warnings
+        # go to messages when it is a list (see ModalState)
+        state = ModalState()
+        state.messages = messages
+        for data in _read_buffers(self.gcode_file_path):
+            block = _interpret(data, state, self._arc_tolerance_mm(), fields)
+            self.mode = state.mode
+            yield block
+        if self.mode is None:
+            self.mode = "vector"
+
+    def _scaled_blocks(self, fields=CHUNK_DTYPE.names):
+        # Moves of the file scaled like GcodeParser's coordinates, one set of columns per parse buffer
+        for block in self._blocks(fields):
+            block['x'] *= self.scale
+            block['y'] *= self.scale
+            yield block
+
+    def iter_chunks(self, n_points):
+        # Yields CHUNK_DTYPE arrays of n_points moves (the last one may be shorter) with every
+        # move of the file, laser-off moves included, scaled like GcodeParser's coordinates.
+        # All modal state (position, G90/G91, G20/G21, motion command, laser) carries across chunks.
+        if n_points <= 0:
+            raise ValueError("n_points must be positive.")
+        return self._chunks(n_points)
+
+    def _chunks(self, n_points):
+        # Pieces of blocks are collected and joined once per chunk, so every move is copied once
+        pending, count = [], 0
+        for block in map(_records, self._scaled_blocks()):
+            while len(block):
+                take = min(n_points - count, len(block))
+                pending.append(block[:take])
+                count += take
+                block = block[take:]
+                if count == n_points:
+                    yield np.concatenate(pending)
+                    pending, count = [], 0
+        if pending:
+            yield np.concatenate(pending)
+
+
+class GcodeParser(GcodeReader):
+    def __init__(self, gcode_file_path, scale=1.0, sidecar=False, workers=1, arc_tolerance=ARC_TOLERANCE):
+        # Construction reads nothing: the file is parsed on the first call of a getter that
+        # needs the moves, while get_mode(), get_image_dimensions() and get_stats() answer
+        # from a scan that keeps no coordinate arrays until then
+        super().__init__(gcode_file_path, scale, arc_tolerance)
         self.frames = []
-        self.x_coords = []
-        self.y_coords = []
-        # self.laser_state = []
+        self.x_coords = np.zeros(0)
+        self.y_coords = np.zeros(0)
+        # Every move of the file, laser-off moves included, as one contiguous array per CHUNK_DTYPE
+        # field with coordinates scaled like x_coords; x_coords is moves['x'] itself unless
+        # laser-off moves are dropped. The coordinate getters only parse COORDINATE_FIELDS, and
+        # the other columns are parsed when first asked for.
+        self.moves = _empty_moves()
         self.img_width = 0
         self.img_height = 0
-        self.mode = None
-        
-        self._determine_mode()
-        
-        if self.mode == "raster":
-            self.parse_raster_gcode()
-        elif self.mode == "vector":
-            self.parse_vector_gcode()
+        # With sidecar the interpreted moves are kept next to the file in <file>.npz and
+        # reloaded instead of parsing while the file is unchanged
+        self.sidecar = sidecar
+        self.sidecar_path = gcode_file_path + ".npz"
+        # With several workers byte ranges of the file are interpreted in a process pool
+        self.workers = workers
+        self._parsed = False
+        self._laser_only = None
+        self._scanned_stats = None
+
+    def _has_columns(self, fields):
+        return self._parsed and self.moves.keys() >= set(fields)
+
+    def _ensure_parsed(self, fields=CHUNK_DTYPE.names):
+        if not self._has_columns(fields):
+            # A second pass for more columns does not repeat the warnings of the first
+            self._parse_gcode(self._laser_only, fields, [] if self._parsed else None)
+
+    def _load_sidecar(self, key):
+        # Moves from a sidecar written for this exact file, else None
+        try:
+            with np.load(self.sidecar_path, allow_pickle=False) as sidecar:
+                if str(sidecar['key']) != key:
+                    return None
+                moves = {field: sidecar[field] for field in CHUNK_DTYPE.names}
+                self.mode = str(sidecar['mode'])
+                return moves
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def _save_sidecar(self, key, moves):
+        # Written next to the file and moved into place, so readers never see half a sidecar
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.sidecar_path)), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file, key=key, mode=self.mode, **moves)
+            os.replace(temp_path, self.sidecar_path)
+        except OSError as error:
+            print(f"Could not write G-code sidecar {self.sidecar_path}: {error}")
+
+    def _read_moves(self, fields, messages=None):
+        # Every move of the file with at least the given columns, from the sidecar when it is
+        # valid. Sidecars and parallel parses always hold every column.
+        key = _file_key(self.gcode_file_path, self._arc_tolerance_mm()) if self.sidecar else None
+        if self.sidecar:
+            moves = self._load_sidecar(key)
+            if moves is not None:
+                return moves
+
+        if self.workers > 1 and os.path.getsize(self.gcode_file_path) > self.workers * BLOCK_SIZE:
+            blocks = self._parallel_blocks()
         else:
-            raise ValueError("Unsupported mode. Use 'raster' or 'vector'.")
-        
-    def _determine_mode(self):
-        with open(self.gcode_file_path, 'r') as file:
-            for line in file:
-                parts = line.split()
-                if not parts:
-                    continue  # skip empty lines
-                mode = parts[0].lower()
-                if mode == 'raster':
-                    self.mode = 'raster'
-                    break
-                elif mode == 'vector':
-                    self.mode = 'vector'
-                    break
+            blocks = list(self._blocks(CHUNK_DTYPE.names if self.sidecar else fields, messages))
+        moves = _join_moves(blocks)
+        if self.sidecar:
+            self._save_sidecar(key, moves)
+        return moves
+
+    def _parallel_blocks(self):
+        # Every range is interpreted from a default state with an active motion command (the
+        # first one from the real start). A prefix pass then walks the ranges in order with the
+        # real state: moves that took the laser state, power, feed, motion command or an unchanged
+        # position from the default start are patched in place, and a range that relied on
+        # other starting values that turn out different is interpreted again from the real state.
+        # Arcs whose shape depends on the starting motion command or position count as relying on it.
+        ranges = _line_ranges(self.gcode_file_path, self.workers)
+        assumed = [-1.0 if start == 0 else 1.0 for start, _ in ranges]
+        tolerance = self._arc_tolerance_mm()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(_interpret_range, [self.gcode_file_path] * len(ranges),
+                                        *zip(*ranges), assumed, [tolerance] * len(ranges)))
+
+        state = ModalState()
+        blocks = []
+        for (start, end), motion, (block, end_state) in zip(ranges, assumed, results):
+            reads = end_state.reads
+            default = ModalState()
+            if ((reads['motion'] and (state.motion >= 0) != (motion >= 0))
+                    or (reads['absolute'] and state.absolute != default.absolute)
+                    or ((reads['inches'] or reads.get('feed_units')) and state.inches != default.inches)
+                    or (reads.get('x_relative') and state.x != default.x)
+                    or (reads.get('y_relative') and state.y != default.y)
+                    or (reads.get('header') and state.mode is not None)
+                    or ((reads['motion'] or reads.get('arc_words')) and state.motion in ARC_CODES)
+                    or (reads.get('arc_start') and (state.x, state.y) != (default.x, default.y))):
+                buffers = _read_buffers(self.gcode_file_path, BLOCK_SIZE, start, end)
+                blocks.extend(_interpret(data, state, tolerance) for data in buffers)
+                continue
+
+            for message in end_state.messages:
+                print(message)
+            block['laser_on'][:reads['laser_on']] = state.laser_on
+            block['power'][:reads['power']] = np.clip(np.rint(state.power), 0, np.iinfo(np.uint16).max)
+            block['feed'][:reads['feed']] = state.feed
+            if motion >= 0 and reads['motion']:
+                block['move_type'][:reads['motion']] = state.motion
+            for field in ('x', 'y'):
+                if not reads.get(field + '_relative') and not reads.get('arc_start'):
+                    block[field][:reads[field]] = getattr(state, field)
+            blocks.append(block)
+            for field in TRACKED_FIELDS:
+                if field not in end_state.unset or reads.get(field + '_relative'):
+                    setattr(state, field, getattr(end_state, field))
+            if state.mode is None:
+                state.mode = end_state.mode
+        self.mode = state.mode or "vector"
+        return blocks
+
+    def _parse_gcode(self, laser_only=None, fields=CHUNK_DTYPE.names, messages=None):
+        # One pass over the file for the given move columns; the mode found in it decides which
+        # moves are kept unless laser_only says otherwise. Coordinates end up in contiguous
+        # float64 arrays.
+        moves = self._read_moves(fields, messages)
+        moves['x'] *= self.scale
+        moves['y'] *= self.scale
+        self.moves = moves
+        if laser_only is None:
+            laser_only = self.mode == "raster"
+        self._laser_only = laser_only
+        self._parsed = True
+        self._scanned_stats = None
+        self.x_coords, self.y_coords = moves['x'], moves['y']
+        if laser_only:
+            self.x_coords = self.x_coords[moves['laser_on']]
+            self.y_coords = self.y_coords[moves['laser_on']]
+
+        if len(self.x_coords):
+            self.img_width = _sequential_max(self.x_coords) / self.scale
+        if len(self.y_coords):
+            self.img_height = _sequential_max(self.y_coords) / self.scale
 
     def parse_raster_gcode(self):
-        with open(self.gcode_file_path, 'r') as file:
-            lines = file.readlines()
-            for line in tqdm(lines, desc="Parsing Raster G-code"):
-                parts = line.split()
-                if not parts:
-                    continue  # skip empty lines
-                command = parts[0]
-                if command in {'G00', 'G0', 'G01', 'G1'}:
-                    new_x, new_y = None, None
-                    laser_on = False
-                    for part in parts[1:]:
-                        if part.startswith('X'):
-                            try:
-                                new_x = float(part[1:]) * self.scale
-                            except ValueError:
-                                print(f"Skipping line with invalid X coordinate: {line}")
-                                continue
-                        elif part.startswith('Y'):
-                            try:
-                                new_y = float(part[1:]) * self.scale
-                            except ValueError:
-                                print(f"Skipping line with invalid Y coordinate: {line}")
-                                continue
-                        elif part.startswith('M3'):
-                            laser_on = True
-                        elif part.startswith('M5'):
-                            laser_on = False
-    
-                    if new_x is not None and new_y is not None and laser_on:
-                        self.x_coords.append(new_x)
-                        self.y_coords.append(new_y)
-    
-            if self.x_coords:
-                self.img_width = max(self.x_coords) / self.scale
-            if self.y_coords:
-                self.img_height = max(self.y_coords) / self.scale
+        # Raster jobs only keep the points where the laser is switched on
+        self._parse_gcode(laser_only=True)
 
     def parse_vector_gcode(self):
-        with open(self.gcode_file_path, 'r') as file:
-            lines = file.readlines()
-            for line in tqdm(lines, desc="Parsing Vector G-code"):
-                parts = line.split()
-                if not parts:
-                    continue  # skip empty lines
-                command = parts[0]
-                if command in {'G00', 'G0', 'G01', 'G1'}:
-                    new_x, new_y = None, None
-                    for part in parts[1:]:
-                        if part.startswith('X'):
-                            try:
-                                new_x = float(part[1:]) * self.scale
-                            except ValueError:
-                                print(f"Skipping line with invalid X coordinate: {line}")
-                                continue
-                        elif part.startswith('Y'):
-                            try:
-                                new_y = float(part[1:]) * self.scale
-                            except ValueError:
-                                print(f"Skipping line with invalid Y coordinate: {line}")
-                                continue
-                    
-                    if new_x is not None and new_y is not None:
-                        self.x_coords.append(new_x)
-                        self.y_coords.append(new_y)
-                        
-            if self.x_coords:
-                self.img_width = max(self.x_coords) / self.scale
-            if self.y_coords:
-                self.img_height = max(self.y_coords) / self.scale
+        self._parse_gcode(laser_only=False)
 
     def get_frames(self):
         return self.frames
-    
+
     def get_x_coords(self):
+        self._ensure_parsed(COORDINATE_FIELDS)
         return self.x_coords
-    
+
     def get_y_coords(self):
+        self._ensure_parsed(COORDINATE_FIELDS)
         return self.y_coords
-    
-    # def get_laser_state(self):
-    #     return self.laser_state
+
+    def get_laser_state(self):
+        # Per move of get_moves(): laser switched on (M3/M4) or off
+        self._ensure_parsed(COORDINATE_FIELDS)
+        return self.moves['laser_on']
+
+    def get_power(self):
+        # Per move of get_moves(): S power in effect
+        self._ensure_parsed()
+        return self.moves['power']
+
+    def get_move_types(self):
+        # Per move of get_moves(): the G code that made it, 0 for a jump (G0) and 1-3 for G1-G3;
+        # every chord end of an arc carries its G2/G3
+        self._ensure_parsed()
+        return self.moves['move_type']
+
+    def get_moves(self):
+        # CHUNK_DTYPE array of every move, joined from the move columns on each call
+        self._ensure_parsed()
+        return _records(self.moves)
+
+    def _masked_coords(self, keep):
+        # Views of all move coordinates with the other moves masked out; the moves are parsed
+        return (np.ma.masked_array(self.moves['x'], mask=~keep),
+                np.ma.masked_array(self.moves['y'], mask=~keep))
+
+    def get_marks(self):
+        # Coordinates of the marking moves: laser on and not a G0 jump
+        self._ensure_parsed()
+        return self._masked_coords(self.moves['laser_on'] & (self.moves['move_type'] != 0))
+
+    def get_jumps(self):
+        self._ensure_parsed()
+        return self._masked_coords(~self.moves['laser_on'] | (self.moves['move_type'] == 0))
+
+    def get_mode(self):
+        # 'raster', 'span' or 'vector'; before parsing only the file header is read
+        if self.mode is None:
+            self.mode = _header_mode(self.gcode_file_path)
+        return self.mode
 
     def get_image_dimensions(self):
-        return self.img_width, self.img_height
+        if self._parsed:
+            return self.img_width, self.img_height
+        stats = self.get_stats()
+        return stats['img_width'], stats['img_height']
+
+    def get_stats(self):
+        # Mode, move and mark counts, bounding box of all moves and laser-on path length in
+        # output units, image dimensions as get_image_dimensions() gives them and the laser-on
+        # time in seconds at the feed rates of the marks. Before parsing the file is scanned
+        # block by block for STATS_FIELDS alone, without S words or power, and reduced without
+        # keeping coordinate arrays; the result is kept.
+        scanned = not self._has_columns(STATS_FIELDS)
+        if not scanned:
+            blocks, laser_only = [self.moves], self._laser_only
+        elif self._scanned_stats is not None:
+            return self._scanned_stats
+        else:
+            blocks, laser_only = self._scaled_blocks(STATS_FIELDS), None
+        stats, length_over_feed, largest = _move_stats(blocks)
+        if laser_only is None:
+            laser_only = self.mode == "raster"
+        # The extents come back to file units exactly as _parse_gcode divides them
+        extent = largest[laser_only]
+        width, height = (float(extent[field] / self.scale) if field in extent else 0 for field in ('x', 'y'))
+        stats.update(mode=self.mode, img_width=width, img_height=height,
+                     on_time=length_over_feed * 60 / abs(self.scale))
+        if scanned:
+            self._scanned_stats = stats
+        return stats
@@ -1,9 +1,305 @@
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import cv2
 import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from scipy.spatial import cKDTree
 from tqdm import tqdm  # Import tqdm for progress bar
 
+from BinaryJob import MEMORY_RECORD_DTYPE, BinaryJobWriter, JobRecords
+from PathOrdering import PathOrdering
+
+# Number of pixels converted per buffered write in raster mode
+RASTER_BLOCK_PIXELS = 1 << 16
+
+# G-code tail for every laser power level; power 0 switches the laser off
+POWER_TAILS = ["M5 S00\n"] + [f"M3 S{power}\n" for power in range(1, 256)]
+
+# 4x4 Bayer matrix scaled to grey-level thresholds for ordered dithering
+BAYER_THRESHOLDS = (np.array([[0, 8, 2, 10],
+                              [12, 4, 14, 6],
+                              [3, 11, 1, 9],
+                              [15, 7, 13, 5]]) + 0.5) * (255 / 16)
+
+
+def _open_gray_rows(image_file_path):
+    # Row-addressable grayscale source for tiled processing. Binary 8-bit PGM
+    # files are memory-mapped so only the rows of the current band are paged
+    # in; every other format is decoded once by OpenCV.
+    if os.path.splitext(image_file_path)[1].lower() == '.pgm':
+        with open(image_file_path, 'rb') as f:
+            header = []
+            while len(header) < 4:
+                line = f.readline()
+                if not line:
+                    break
+                header += line.split(b'#')[0].split()
+            offset = f.tell()
+        if len(header) == 4 and header[0] == b'P5' and int(header[3]) < 256:
+            width, height = int(header[1]), int(header[2])
+            return np.memmap(image_file_path, dtype=np.uint8, mode='r', offset=offset, shape=(height, width))
+    return cv2.imread(image_file_path, cv2.IMREAD_GRAYSCALE)
+
+
+def _text_table(strings):
+    # Pack strings into a zero-padded fixed-width byte table, one row per string
+    encoded = [s.encode('ascii') for s in strings]
+    width = max(1, max(map(len, encoded), default=0))
+    return np.frombuffer(b"".join(s.ljust(width, b"\0") for s in encoded), dtype=np.uint8).reshape(-1, width)
+
+
+def _join_segments(table, segments):
+    # Concatenate the table rows listed in segments, dropping the padding bytes
+    joined = table[segments].ravel()
+    return joined[joined != 0].tobytes().decode('ascii')
+
+
+def _visit_columns(rows, new_width, raster_direction):
+    # Column visit order per row; odd rows run backwards in bi-directional mode
+    columns = np.broadcast_to(np.arange(new_width), (len(rows), new_width))
+    if raster_direction == 'bi':
+        columns = np.where((rows % 2 == 1)[:, None], columns[:, ::-1], columns)
+    return columns
+
+
+def _raster_moves(band, row0, raster_direction, new_height):
+    # Moves for a band of laser power values starting at image row row0, as
+    # parallel (column, row, power, line feed) arrays in emission order. In
+    # uni-directional mode every row but the last ends with a laser-off line feed.
+    band_height, new_width = band.shape
+    rows = np.arange(row0, row0 + band_height)
+    columns = _visit_columns(rows, new_width, raster_direction)
+
+    emit = np.ones((band_height, new_width + 1), dtype=bool)
+    emit[:, -1] = (raster_direction == 'uni') & (rows + 1 < new_height) & (new_width > 0)
+    move_columns = np.column_stack((columns, np.full(band_height, new_width - 1)))
+    move_power = np.column_stack((np.take_along_axis(band, columns, axis=1), np.zeros(band_height, dtype=band.dtype)))
+    feed = np.zeros(emit.shape, dtype=bool)
+    feed[:, -1] = True
+    move_rows = np.broadcast_to(rows[:, None], emit.shape)
+    return move_columns[emit], move_rows[emit], move_power[emit], feed[emit]
+
+
+def _span_moves(band, row0, raster_direction, new_height):
+    # Span moves for a band of laser power values: one move per run of equal power. Moves end
+    # on pixel edges, edge c being the left edge of pixel c, so every run covers the full width
+    # of its pixels whichever way the row is visited
+    band_height, new_width = band.shape
+    rows = np.arange(row0, row0 + band_height)
+    columns = _visit_columns(rows, new_width, raster_direction)
+    power = np.take_along_axis(band, columns, axis=1)
+    laser_on = power != 0
+    # Edges where the beam enters and leaves each pixel in visit order
+    backwards = ((raster_direction == 'bi') & (rows % 2 == 1))[:, None]
+    enter = columns + backwards
+    leave = columns + ~backwards
+
+    # A run ends wherever the next pixel changes power; blank space before the
+    # first and after the last lit pixel of a row is trimmed away
+    run_end = np.ones_like(laser_on)
+    run_end[:, :-1] = power[:, :-1] != power[:, 1:]
+    lit = np.logical_or.accumulate(laser_on, axis=1) & np.logical_or.accumulate(laser_on[:, ::-1], axis=1)[:, ::-1]
+    run_end &= lit
+
+    # Each lit row starts with a laser-off jump onto its first lit pixel, so runs of empty
+    # rows collapse into that single jump; every run then ends where the next one begins
+    first_lit = np.argmax(laser_on, axis=1)
+    emit = np.column_stack((lit.any(axis=1), run_end))
+    move_columns = np.column_stack((enter[np.arange(band_height), first_lit], leave))
+    move_power = np.column_stack((np.zeros(band_height, dtype=power.dtype), power))
+    move_rows = np.broadcast_to(rows[:, None], emit.shape)
+    return move_columns[emit], move_rows[emit], move_power[emit], np.zeros(emit.sum(), dtype=bool)
+
+
+def _moves_gcode(moves, x_scaled, y_scaled, y_next):
+    # Render moves as G-code text; x_scaled holds the coordinate of every pixel edge
+    columns, rows, power, feed = moves
+    if not len(columns):
+        return ""
+    row0 = int(rows.min())
+    band_rows = range(row0, int(rows.max()) + 1)
+
+    # Table layout: an empty entry, one "G01 X.. Y" prefix per column, one
+    # "Y.. " text per row, one tail per power level, then one line feed per row
+    texts = [""]
+    texts += [f"G01 X{x:.6f} Y" for x in x_scaled.tolist()]
+    texts += [f"{y_scaled[y]:.6f} " for y in band_rows]
+    texts += POWER_TAILS
+    # Line feeds start from the last pixel of the row
+    last_x = f"{x_scaled[-2]:.6f}"
+    texts += [f"G1 X{last_x} Y{y_next[y]:.6f} M5 S00\n" for y in band_rows]
+    table = _text_table(texts)
+
+    y_text = 1 + len(x_scaled) + rows - row0
+    power_text = 1 + len(x_scaled) + len(band_rows) + power.astype(np.int64)
+    feed_text = 1 + len(x_scaled) + len(band_rows) + len(POWER_TAILS) + rows - row0
+
+    # Line feeds are a single pre-formatted line padded with two empty entries
+    segments = np.column_stack((np.where(feed, 0, 1 + columns),
+                                np.where(feed, 0, y_text),
+                                np.where(feed, feed_text, power_text)))
+    return _join_segments(table, segments.ravel())
+
+
+def _moves_records(moves, x_scaled, y_scaled, y_next):
+    # Render moves as binary job records
+    columns, rows, power, feed = moves
+    records = np.empty(len(columns), dtype=MEMORY_RECORD_DTYPE)
+    records['x'] = x_scaled[columns]
+    records['y'] = np.where(feed, y_next[rows], y_scaled[rows])
+    records['power'] = power
+    return records
+
+
+def _band_output(band, row0, band_moves, render, x_scaled, y_scaled, y_next):
+    # Convert one band of laser power values into rendered output
+    return render(band_moves(band, row0), x_scaled, y_scaled, y_next)
+
+
+def _area_table(source_size, target_size):
+    # OpenCV's INTER_AREA weights along one axis, as computeResizeAreaTab builds them: the
+    # source pixels each target pixel covers and their float32 coverage, in OpenCV's
+    # summation order and padded with zero weights to the same count per target pixel
+    scale = 1.0 / (target_size / source_size)
+    sources, weights = [], []
+    for target in range(target_size):
+        start = target * scale
+        end = start + scale
+        cell = min(scale, source_size - start)
+        last = min(math.floor(end), source_size - 1)
+        first = min(math.ceil(start), last)
+        pixels, pixel_weights = list(range(first, last)), [1.0 / cell] * (last - first)
+        if first - start > 1e-3:
+            pixels.insert(0, first - 1)
+            pixel_weights.insert(0, (first - start) / cell)
+        if end - last > 1e-3:
+            pixels.append(last)
+            pixel_weights.append(min(end - last, 1.0, cell) / cell)
+        sources.append(pixels)
+        weights.append(pixel_weights)
+    count = max(len(pixels) for pixels in sources)
+    index = np.array([pixels + pixels[:1] * (count - len(pixels)) for pixels in sources], dtype=np.intp)
+    weight = np.array([w + [0.0] * (count - len(w)) for w in weights], dtype=np.float32)
+    return index, weight
+
+
+def _area_resample(rows, x_table, y_table):
+    # INTER_AREA resize of 8-bit rows computed the way OpenCV's general area path does it:
+    # every source row is resampled along x, then the target rows are weighted sums of
+    # those, both accumulated in float32 in OpenCV's order and rounded half to even
+    x_index, x_weight = x_table
+    y_index, y_weight = y_table
+    resampled = np.zeros((len(rows), len(x_index)), dtype=np.float32)
+    for k in range(x_index.shape[1]):
+        resampled += rows[:, x_index[:, k]].astype(np.float32) * x_weight[:, k]
+    band = y_weight[:, :1] * resampled[y_index[:, 0]]
+    for k in range(1, y_index.shape[1]):
+        band += y_weight[:, k:k + 1] * resampled[y_index[:, k]]
+    return np.clip(np.rint(band), 0, 255).astype(np.uint8)
+
+
+def _ordered_dither(gray, row0):
+    # Ordered dithering against a Bayer matrix tiled from absolute image row row0
+    rows = (np.arange(row0, row0 + gray.shape[0]) % 4)[:, None]
+    columns = (np.arange(gray.shape[1]) % 4)[None, :]
+    return np.where(gray > BAYER_THRESHOLDS[rows, columns], 255, 0).astype(np.uint8)
+
+
+def _error_diffusion(gray, carry, threshold):
+    # Floyd-Steinberg dithering. A pixel only receives error from pixels on
+    # earlier anti-diagonals x + 2y, so each diagonal is quantised in one
+    # vectorised step. Error from the row above and from the left neighbour
+    # are kept apart so a band continued from carry (the error pushed below
+    # the previous band) rounds exactly like an undivided image.
+    height, width = gray.shape
+    below = np.zeros((height + 1, width + 2), dtype=np.float32)
+    below[0, 1:-1] = carry
+    right = np.zeros((height, width + 1), dtype=np.float32)
+    dithered = np.zeros((height, width), dtype=np.uint8)
+    for t in range(width + 2 * (height - 1)):
+        y = np.arange(max(0, (t - width + 2) // 2), min(height - 1, t // 2) + 1)
+        x = t - 2 * y
+        value = gray[y, x] + below[y, x + 1] + right[y, x]
+        laser_on = value > threshold
+        dithered[y, x] = np.where(laser_on, 255, 0)
+        error = value - np.where(laser_on, np.float32(255), np.float32(0))
+        right[y, x + 1] = error * np.float32(7 / 16)
+        below[y + 1, x] += error * np.float32(3 / 16)
+        below[y + 1, x + 1] += error * np.float32(5 / 16)
+        below[y + 1, x + 2] += error * np.float32(1 / 16)
+    return dithered, below[height, 1:-1]
+
+
+def _douglas_peucker(points, tolerance, reference=None):
+    # Indices of the vertices Douglas-Peucker keeps on an open polyline; with reference
+    # (one point per vertex) the chords are checked against the reference points instead
+    if reference is None:
+        reference = points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        # Distance from every inner vertex to the chord segment between first and last
+        inner = reference[first + 1:last] - points[first]
+        chord = points[last] - points[first]
+        chord_length = chord @ chord
+        along = np.clip(inner @ chord / chord_length, 0.0, 1.0) if chord_length else 0.0
+        distance = np.hypot(*(inner - np.multiply.outer(along, chord)).T)
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def _simplify_closed(path, tolerance, reference=None):
+    # Douglas-Peucker on a closed contour, closed through its first vertex
+    if len(path) < 3:
+        return path
+    if reference is not None:
+        reference = np.vstack((reference, reference[:1]))
+    kept = _douglas_peucker(np.vstack((path, path[:1])), tolerance, reference)
+    return path[kept[:-1]]
+
+
+def _fit_closed_curve(path, tolerance):
+    # Smooth the pixel staircase of a closed contour with a circular Gaussian
+    # kernel, narrowing the kernel until every pixel lies within tolerance of
+    # the smoothed outline; contours that cannot be fitted are kept as is
+    if len(path) < 4:
+        return path
+    for sigma in (4.0, 2.0, 1.0):
+        curve = gaussian_filter1d(path, sigma, axis=0, mode='wrap')
+        deviation, _ = cKDTree(curve).query(path)
+        if deviation.max() <= tolerance:
+            return curve
+    return path
+
+
+def _contour_groups(hierarchy):
+    # Group label of every contour from the RETR_TREE hierarchy: the index of its
+    # outermost enclosing contour, so holes and islands nested inside an outline
+    # share that outline's label
+    if hierarchy is None:
+        return np.empty(0, dtype=np.intp)
+    parent = hierarchy[0][:, 3]
+    root = np.arange(len(parent))
+    while (parent[root] >= 0).any():
+        root = np.where(parent[root] >= 0, parent[root], root)
+    return root
+
+
 class ImageToGcode:
-    def __init__(self, image_file_path, output_file_path, downsample_factor, raster_direction, mode="vector", scale=1.0, threshold=128, invert=0, scale_mode="default"):
+    def __init__(self, image_file_path, output_file_path, downsample_factor, raster_direction, mode="vector", scale=1.0, threshold=128, invert=0, scale_mode="default", tile_rows=None, workers=1, tone_mode="threshold", optimize_travel=False, simplify_tolerance=0.0, curve_fit=False, output_format="gcode", cache=None):
         self.image_file = image_file_path
         self.output_file = output_file_path
         self.downsample_factor = downsample_factor
@@ -13,124 +309,301 @@ class ImageToGcode:
         self.threshold = threshold
         self.invert = invert
         self.scale_mode = scale_mode.lower().strip()
+        # Source rows per band when processing the image in tiles; None processes it whole.
+        # Only binary 8-bit PGM files are read band by band; other formats, PNG and JPEG
+        # included, are still decoded whole first and only the later steps are bounded
+        self.tile_rows = tile_rows
+        # Number of processes converting row bands in raster and span modes
+        self.workers = workers
+        # How grey levels become laser power: 'threshold', 'grayscale', 'diffusion' or 'ordered'
+        self.tone_mode = tone_mode.lower().strip()
+        # Reorder vector contours to minimise laser-off jumps between them
+        self.optimize_travel = optimize_travel
+        self.jump_length_before = None
+        self.jump_length_after = None
+        # Maximum deviation in output units (mm) when dropping vector points; see
+        # LaserPathPlanning.dac_steps_to_mm to express it in DAC steps
+        self.simplify_tolerance = simplify_tolerance
+        # Smooth the pixel staircase of the contours before simplifying them; the result
+        # still stays within simplify_tolerance of the pixel outline
+        self.curve_fit = curve_fit
+        # 'gcode' writes text G-code, 'binary' a BinaryJob file of fixed-width records.
+        # Without an output file the job is only kept in memory, see get_job()
+        self.output_format = output_format.lower().strip()
+        self.job = None
+        # Optional ConversionCache reused across conversions of the same image and settings
+        self.cache = cache
+
+        if self.tone_mode not in ("threshold", "grayscale", "diffusion", "ordered"):
+            raise ValueError("Unsupported tone mode. Use 'threshold', 'grayscale', 'diffusion' or 'ordered'.")
+        if mode == "vector" and self.tone_mode != "threshold":
+            raise ValueError("Vector mode only supports the 'threshold' tone mode.")
+        if self.output_format not in ("gcode", "binary"):
+            raise ValueError("Unsupported output format. Use 'gcode' or 'binary'.")
+        if self.curve_fit and not self.simplify_tolerance:
+            raise ValueError("Curve fitting needs a positive simplify_tolerance.")
+
+        if self.cache is not None:
+            cache_key = self.cache.key(self)
+            if self.cache.fetch(cache_key, self):
+                return
 
         if mode == "vector":
             self.imageToVector()
         elif mode == "raster":
             self.imageToRaster()
+        elif mode == "span":
+            self.imageToSpan()
         else:
-            raise ValueError("Unsupported mode. Use 'raster' or 'vector'.")
+            raise ValueError("Unsupported mode. Use 'raster', 'span' or 'vector'.")
+
+        if self.cache is not None:
+            self.cache.store(cache_key, self)
 
-    def _image_Threshold(self):
-        img = cv2.imread(self.image_file, cv2.IMREAD_GRAYSCALE)
+    def _threshold(self, img):
         ret, binary_img = cv2.threshold(img, self.threshold, 255, cv2.THRESH_BINARY)
         if self.invert == 1:
             binary_img = cv2.bitwise_not(binary_img)
         return binary_img
 
-    def imageToVector(self):
-        binary_img = self._image_Threshold()
-        height, width = binary_img.shape
+    def _tone_source(self, img):
+        # Threshold mode binarises before downsampling; the other tone modes keep the grey levels
+        if self.tone_mode == "threshold":
+            return self._threshold(img)
+        if self.invert == 1:
+            return cv2.bitwise_not(img)
+        return img
+
+    def _laser_power(self, band):
+        # Laser power per downsampled pixel; outside grayscale mode only fully lit pixels fire
+        if self.tone_mode == "grayscale":
+            return band
+        return np.where(band == 255, 255, 0).astype(np.uint8)
 
+    def imageToVector(self):
         # Optionally downsample the image to reduce vector points
-        new_height, new_width = height // self.downsample_factor, width // self.downsample_factor
-        downsampled_img = cv2.resize(binary_img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        downsampled_img, width, height = self._downsampled_image()
 
-        contours, _ = cv2.findContours(downsampled_img, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        # Curve fitting needs every boundary pixel, not just the corners of straight runs
+        approximation = cv2.CHAIN_APPROX_NONE if self.curve_fit else cv2.CHAIN_APPROX_SIMPLE
+        contours, hierarchy = cv2.findContours(downsampled_img, cv2.RETR_TREE, approximation)
+        paths = [self._scaled_points(contour.reshape(-1, 2), width, height) for contour in contours]
+        groups = _contour_groups(hierarchy)
         gcode = []
 
+        if self.simplify_tolerance:
+            point_count = sum(len(path) for path in paths)
+            if self.curve_fit:
+                # Vertices come from the smoothed outline, fitted within half the tolerance,
+                # while every chord is checked against the pixel outline it replaces
+                tolerance = self.simplify_tolerance
+                paths = [_simplify_closed(_fit_closed_curve(path, tolerance / 2), tolerance, path) for path in paths]
+            else:
+                paths = [_simplify_closed(path, self.simplify_tolerance) for path in paths]
+            print(f"Simplified vector points: {point_count} -> {sum(len(path) for path in paths)}")
+
+        if self.optimize_travel:
+            ordering = PathOrdering(paths, groups=groups)
+            paths = ordering.get_ordered_paths()
+            self.jump_length_before = ordering.jump_length_before
+            self.jump_length_after = ordering.jump_length_after
+            print(f"Jump length: {self.jump_length_before:.3f} -> {self.jump_length_after:.3f}")
+        elif len(paths):
+            # Traced order with every outline followed directly by the contours nested in it
+            _, first, inverse = np.unique(groups, return_index=True, return_inverse=True)
+            paths = [paths[i] for i in np.argsort(first[inverse], kind='stable')]
+
+        writer = self._job_writer("vector")
+        if writer is not None:
+            # Each contour is entered with the laser off and traced with it on
+            for path in tqdm(paths, desc="Processing contours", unit="contour"):
+                records = np.empty(len(path), dtype=MEMORY_RECORD_DTYPE)
+                records['x'] = path[:, 0]
+                records['y'] = path[:, 1]
+                records['power'] = 255
+                records['power'][:1] = 0
+                writer.write(records)
+            writer.close()
+            return gcode
+
         with open(self.output_file, 'w') as f:
             f.write("vector\n")
-            for contour in tqdm(contours, desc="Processing contours", unit="contour"):
-                for point in contour:
-                    x, y = point[0]
-
-                    # Scale coordinates based on original image dimensions
-                    if self.scale_mode == "default":
-                        x = float(x * self.downsample_factor) * self.scale
-                        y = float(y * self.downsample_factor) * self.scale
-                    elif self.scale_mode == "scale":
-                        x = float(x * self.downsample_factor / width) * self.scale
-                        y = float(y * self.downsample_factor / height) * self.scale
-
+            for path in tqdm(paths, desc="Processing contours", unit="contour"):
+                for x, y in path.tolist():
                     gcode.append(f"G01 X{x:.6f} Y{y:.6f}")
                     f.write(f"G01 X{x:.6f} Y{y:.6f}\n")
 
         return gcode
 
-    def imageToRaster(self):
-        binary_img = self._image_Threshold()
+    def _scaled_points(self, points, width, height):
+        # Scale pixel coordinates based on original image dimensions
+        if self.scale_mode == "default":
+            return (points * self.downsample_factor).astype(np.float64) * self.scale
+        elif self.scale_mode == "scale":
+            return (points * self.downsample_factor / np.array([width, height])) * self.scale
+        else:
+            raise ValueError("Unsupported scale mode. Use 'default' or 'scale'.")
+
+    def _scaled_axis(self, count, size):
+        # Scaled G-code coordinate for every pixel index along one axis
+        index = np.arange(count)
+        if self.scale_mode == "default":
+            return (index * self.downsample_factor).astype(np.float64) * self.scale
+        elif self.scale_mode == "scale":
+            return (index * self.downsample_factor / size) * self.scale
+        else:
+            raise ValueError("Unsupported scale mode. Use 'default' or 'scale'.")
+
+    def _downsampled_bands(self):
+        # Returns the source size, the downsampled size and an iterator of
+        # (first downsampled row, band) pairs in row order
+        if self.tile_rows is None:
+            source = cv2.imread(self.image_file, cv2.IMREAD_GRAYSCALE)
+        else:
+            source = _open_gray_rows(self.image_file)
 
         # Downsample the image to reduce the number of points
-        height, width = binary_img.shape
+        height, width = source.shape
         new_height, new_width = height // self.downsample_factor, width // self.downsample_factor
-        downsampled_img = cv2.resize(binary_img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        if new_height == 0 or new_width == 0:
+            raise ValueError("downsample_factor is larger than the image.")
+        if self.tile_rows is None:
+            band_rows = new_height
+        else:
+            band_rows = max(1, self.tile_rows // self.downsample_factor)
+
+        # Bands reproduce resizing the whole image with INTER_AREA. When both scales are
+        # whole numbers OpenCV averages separate blocks, so bands start on block rows and
+        # OpenCV resizes them; otherwise every band is computed from the source rows it
+        # overlaps with OpenCV's area weights
+        scale_x, scale_y = 1.0 / (new_width / width), 1.0 / (new_height / height)
+        whole_blocks = all(abs(scale - round(scale)) < np.finfo(np.float64).eps for scale in (scale_x, scale_y))
+        if band_rows < new_height and not whole_blocks:
+            x_table = _area_table(width, new_width)
+            y_index, y_weight = _area_table(height, new_height)
+
+        def downsampled_band(row0, row1):
+            if band_rows >= new_height:
+                return cv2.resize(self._tone_source(np.asarray(source)), (new_width, new_height),
+                                  interpolation=cv2.INTER_AREA)
+            if whole_blocks:
+                rows = self._tone_source(np.asarray(source[row0 * round(scale_y):row1 * round(scale_y)]))
+                return cv2.resize(rows, (new_width, row1 - row0), interpolation=cv2.INTER_AREA)
+            first = int(y_index[row0:row1].min())
+            rows = self._tone_source(np.asarray(source[first:int(y_index[row0:row1].max()) + 1]))
+            return _area_resample(rows, x_table, (y_index[row0:row1] - first, y_weight[row0:row1]))
+
+        def bands():
+            carry = np.zeros(new_width, dtype=np.float32)
+            for row0 in range(0, new_height, band_rows):
+                row1 = min(row0 + band_rows, new_height)
+                band = downsampled_band(row0, row1)
+                if self.tone_mode == "diffusion":
+                    band, carry = _error_diffusion(band, carry, self.threshold)
+                elif self.tone_mode == "ordered":
+                    band = _ordered_dither(band, row0)
+                yield row0, band
+
+        return width, height, new_width, new_height, bands()
+
+    def _downsampled_image(self):
+        width, height, new_width, new_height, bands = self._downsampled_bands()
+        downsampled_img = np.vstack([band for row0, band in bands])
+        return downsampled_img.reshape(new_height, new_width), width, height
+
+    def _job_writer(self, mode):
+        # Record sink for the job, or None when writing text G-code
+        if self.output_file is None:
+            self.job = JobRecords(mode)
+            return self.job
+        if self.output_format == "binary":
+            return BinaryJobWriter(self.output_file, mode)
+        return None
+
+    def get_job(self):
+        # In-memory job of a conversion run without an output file
+        return self.job
+
+    def _convert_blocks(self, blocks, band_output):
+        # Yields (row count, rendered output) per block in row order. With several
+        # workers the blocks are converted in a process pool, keeping only a
+        # few blocks in flight so memory stays bounded
+        if self.workers <= 1:
+            for row0, block in blocks:
+                yield block.shape[0], band_output(block, row0)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for row0, block in blocks:
+                pending.append((block.shape[0], executor.submit(band_output, block, row0)))
+                if len(pending) >= 2 * self.workers:
+                    rows, future = pending.popleft()
+                    yield rows, future.result()
+            while pending:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+
+    def _write_bands(self, width, height, new_width, new_height, bands, band_moves, mode):
+        # Emit blocks of whole rows so every write is a large buffered chunk;
+        # parallel runs use larger blocks to amortise the inter-process transfer
+        block_pixels = RASTER_BLOCK_PIXELS if self.workers <= 1 else RASTER_BLOCK_PIXELS * 4
+        rows_per_block = max(1, block_pixels // max(new_width, 1))
+
+        # Pixel columns and the right edge of the last one, where span moves may end
+        x_scaled = self._scaled_axis(new_width + 1, width)
+        y_scaled = self._scaled_axis(new_height, height)
+        # The uni-directional line feed always uses the default scaling
+        y_next = (np.arange(1, new_height + 1, dtype=np.float64) * self.downsample_factor) * self.scale
+        writer = self._job_writer(mode)
+        render = _moves_gcode if writer is None else _moves_records
+        band_output = partial(_band_output, band_moves=band_moves, render=render,
+                              x_scaled=x_scaled, y_scaled=y_scaled, y_next=y_next)
+
+        def blocks():
+            for band_row0, band in bands:
+                power = self._laser_power(band)
+                for row0 in range(0, power.shape[0], rows_per_block):
+                    yield band_row0 + row0, power[row0:row0 + rows_per_block]
+
+        with tqdm(total=new_height, desc="Processing rows", unit="row") as progress:
+            if writer is not None:
+                for rows, records in self._convert_blocks(blocks(), band_output):
+                    writer.write(records)
+                    progress.update(rows)
+                writer.close()
+            else:
+                with open(self.output_file, 'w') as f:
+                    f.write(f"{mode}\n")
+                    for rows, text in self._convert_blocks(blocks(), band_output):
+                        f.write(text)
+                        progress.update(rows)
+
+    def imageToRaster(self):
+        width, height, new_width, new_height, bands = self._downsampled_bands()
 
         gcode = []
 
-        def uni_dir_raster():
-            with open(self.output_file, 'w') as f:
-                f.write("raster\n")
-                for y in tqdm(range(new_height), desc="Processing rows", unit="row"):
-                    row = downsampled_img[y]
-                    for x in range(new_width):
-
-                        # Store the original x and y for indexing
-                        original_x = x
-                        original_y = y
-
-                        # Calculate the scaled x and y for G-code
-                        if self.scale_mode == "default":
-                            scaled_x = float(original_x * self.downsample_factor) * self.scale
-                            scaled_y = float(original_y * self.downsample_factor) * self.scale
-                        elif self.scale_mode == "scale":
-                            scaled_x = float(original_x * self.downsample_factor / width) * self.scale
-                            scaled_y = float(original_y * self.downsample_factor / height) * self.scale
-
-                        # Use original x for indexing the row
-                        if row[original_x] == 255:
-                            f.write(f"G01 X{scaled_x:.6f} Y{scaled_y:.6f} M3 S255\n")
-                        else:
-                            f.write(f"G01 X{scaled_x:.6f} Y{scaled_y:.6f} M5 S00\n")
-
-                    # Move to the start of the next line (in Y axis) with the laser off
-                    if y + 1 < new_height:
-                        scaled_y_next = float(y + 1) * self.downsample_factor * self.scale
-                        next_line_move = f"G1 X{scaled_x:.6f} Y{scaled_y_next:.6f} M5 S00\n"
-                        f.write(next_line_move)
-
-        def bi_dir_raster():
-            with open(self.output_file, 'w') as f:
-                f.write("raster\n")
-                for y in tqdm(range(new_height), desc="Processing rows", unit="row"):
-                    row = downsampled_img[y]
-
-                    # Alternate the direction of the X-axis depending on the Y-axis line number
-                    x_range = range(new_width) if y % 2 == 0 else range(new_width - 1, -1, -1)
-
-                    for x in x_range:
-
-                        # Store the original x and y for indexing
-                        original_x = x
-                        original_y = y
-
-                        # Calculate the scaled x and y for G-code
-                        if self.scale_mode == "default":
-                            scaled_x = float(original_x * self.downsample_factor) * self.scale
-                            scaled_y = float(original_y * self.downsample_factor) * self.scale
-                        elif self.scale_mode == "scale":
-                            scaled_x = float(original_x * self.downsample_factor / width) * self.scale
-                            scaled_y = float(original_y * self.downsample_factor / height) * self.scale
-
-                        # Use original x for indexing the row
-                        if row[original_x] == 255:
-                            f.write(f"G01 X{scaled_x:.6f} Y{scaled_y:.6f} M3 S255\n")
-                        else:
-                            f.write(f"G01 X{scaled_x:.6f} Y{scaled_y:.6f} M5 S00\n")
-
-        if self.raster_direction == 'uni':
-            uni_dir_raster()
-        elif self.raster_direction == 'bi':
-            bi_dir_raster()
+        if self.raster_direction not in ('uni', 'bi'):
+            return gcode, new_width, new_height
+
+        band_moves = partial(_raster_moves, raster_direction=self.raster_direction, new_height=new_height)
+        self._write_bands(width, height, new_width, new_height, bands, band_moves, "raster")
+
+        return gcode, new_width, new_height
+
+    def imageToSpan(self):
+        # Raster variant that collapses runs of equal laser state into single moves. The job
+        # gets a 'span' header: unlike raster jobs, its laser-off moves carry the start of every
+        # run, so readers keep all of its points.
+        width, height, new_width, new_height, bands = self._downsampled_bands()
+
+        gcode = []
+
+        if self.raster_direction not in ('uni', 'bi'):
+            return gcode, new_width, new_height
+
+        band_moves = partial(_span_moves, raster_direction=self.raster_direction, new_height=new_height)
+        self._write_bands(width, height, new_width, new_height, bands, band_moves, "span")
 
         return gcode, new_width, new_height
@@ -1,10 +1,185 @@
 import numpy as np
 from scipy.interpolate import interp1d
-from tqdm import tqdm  # Import tqdm for progress bar
+
+# Attributes the DAC conversion depends on; assigning any of them drops the converted values
+TRANSFORM_FIELDS = frozenset(("X_Coords", "Y_Coords", "Laser_Distance", "phi_min_deg", "phi_max_deg",
+                              "dac_resolution", "correction"))
+# Attributes the smoothed DAC values additionally depend on
+SMOOTH_FIELDS = frozenset(("intrp_mode",))
+# Attributes the resampled path additionally depends on
+RESAMPLE_FIELDS = frozenset(("mark_speed", "jump_speed", "galvo_kpps", "laser_on", "jump_planner"))
+# Default beam speeds in the field, in mm/s
+DEFAULT_MARK_SPEED = 1000.0
+DEFAULT_JUMP_SPEED = 4000.0
+
+
+def _append(buffer, count, values):
+    # Writes values after the first count entries of buffer, growing it geometrically so that
+    # repeated appends cost linear time overall; returns the buffer, which may be a new one
+    end = count + len(values)
+    if end > len(buffer):
+        grown = np.empty(max(end, 2 * len(buffer)), dtype=buffer.dtype)
+        grown[:count] = buffer[:count]
+        buffer = grown
+    buffer[count:end] = values
+    return buffer
+
+
+def dac_steps_to_mm(steps, laser_distance, dac_res=4096):
+    # Field distance covered by a number of DAC steps at the centre of the field;
+    # the DAC mapping spans 360 degrees of beam angle over the full DAC range
+    return laser_distance * np.tan(np.deg2rad(steps * 360.0 / dac_res))
+
+
+def sample_dtype(dtype):
+    # One DAC sample as streamed by LaserPathPlanning.iter_dac_samples
+    return np.dtype([('x', dtype), ('y', dtype), ('laser_on', '?')])
+
+
+def _check_rates(mark_speed, jump_speed, points_per_second):
+    if mark_speed <= 0 or jump_speed <= 0 or points_per_second <= 0:
+        raise ValueError("Mark speed, jump speed and the galvo point rate must be positive.")
+
+
+def _path_arrays(x_coords, y_coords, laser_on=None):
+    # Coordinates and laser states as arrays of equal length, paired up to the shorter coordinates
+    x_coords = np.asarray(x_coords, dtype=np.float64)
+    y_coords = np.asarray(y_coords, dtype=np.float64)
+    count = min(len(x_coords), len(y_coords))
+    if laser_on is None:
+        laser_on = np.ones(count, dtype=bool)
+    elif len(laser_on) < count:
+        raise ValueError("laser_on needs one state per point.")
+    return x_coords[:count], y_coords[:count], np.asarray(laser_on, dtype=bool)[:count]
+
+
+def _segment_times(x_coords, y_coords, laser_on, mark_speed, jump_speed, jump_planner=None):
+    # Per segment between neighbouring points: its extent, length, laser state and duration,
+    # which segments are jumps the planner profiles (None without a planner) and the time each
+    # segment ends, counted from the first point
+    dx, dy = np.diff(x_coords), np.diff(y_coords)
+    length = np.hypot(dx, dy)
+    segment_on = laser_on[1:]
+    duration = length / np.where(segment_on, mark_speed, jump_speed)
+    profiled = None
+    if jump_planner is not None:
+        profiled = ~segment_on & (length > jump_planner.short_jump)
+        duration[profiled] = jump_planner.jump_times(length[profiled])
+    return dx, dy, length, segment_on, duration, profiled, np.cumsum(duration)
+
+
+def _positions_at(x_coords, y_coords, segments, times, jump_planner=None):
+    # Beam position and laser state at the given times. Segments of no length are never picked
+    # except for the start of the path.
+    dx, dy, length, segment_on, duration, profiled, ends = segments
+    segment = np.minimum(np.searchsorted(ends, times), len(ends) - 1)
+    starts = ends[segment] - duration[segment]
+    fraction = np.ones(len(times))
+    np.divide(times - starts, duration[segment], out=fraction, where=duration[segment] > 0)
+    np.clip(fraction, 0.0, 1.0, out=fraction)
+    if profiled is not None:
+        jumping = profiled[segment]
+        if jumping.any():
+            lengths = length[segment[jumping]]
+            fraction[jumping] = jump_planner.travelled(lengths, times[jumping] - starts[jumping]) / lengths
+    return (x_coords[segment] + fraction * dx[segment], y_coords[segment] + fraction * dy[segment],
+            segment_on[segment])
+
+
+def _rebatch(sample_chunks, block_size, dtype):
+    # Regroups arrays of samples into blocks of block_size samples; the last may be shorter
+    block = np.empty(block_size, dtype=dtype)
+    filled = 0
+    for samples in sample_chunks:
+        start = 0
+        while start < len(samples):
+            take = min(block_size - filled, len(samples) - start)
+            block[filled:filled + take] = samples[start:start + take]
+            filled += take
+            start += take
+            if filled == block_size:
+                yield block
+                block = np.empty(block_size, dtype=dtype)
+                filled = 0
+    if filled:
+        yield block[:filled]
+
+
+def resample_path(x_coords, y_coords, laser_on, mark_speed, jump_speed, points_per_second, jump_planner=None):
+    # Points along the path at a constant rate: the beam crosses every segment in a straight
+    # line at the mark speed if the laser is on for it and at the jump speed otherwise (mm/s),
+    # and a point is emitted every 1 / points_per_second seconds. With a JumpPlanner, jumps
+    # longer than its short_jump follow its profile instead. laser_on has one state per point
+    # for the segment ending there, like GcodeParser.get_laser_state; None marks every segment.
+    # Returns x, y and laser state per emitted point; the last point of the path is always
+    # emitted.
+    _check_rates(mark_speed, jump_speed, points_per_second)
+    x_coords, y_coords, laser_on = _path_arrays(x_coords, y_coords, laser_on)
+    if len(x_coords) < 2:
+        return x_coords.copy(), y_coords.copy(), laser_on.copy()
+
+    segments = _segment_times(x_coords, y_coords, laser_on, mark_speed, jump_speed, jump_planner)
+    total = segments[-1][-1]
+    times = np.arange(int(total * points_per_second) + 1) / points_per_second
+    if times[-1] < total:
+        times = np.append(times, total)
+    return _positions_at(x_coords, y_coords, segments, times, jump_planner)
+
+
+class JumpPlanner:
+
+    def __init__(self, max_velocity, acceleration, settle_lengths=(0.0,), settle_times=(0.0,), short_jump=0.0):
+        # Acceleration-limited laser-off jumps: the beam speeds up at acceleration (mm/s^2) to at
+        # most max_velocity (mm/s), slows down onto the target and then holds there while the
+        # mirrors settle. Settling takes settle_times seconds after jumps of settle_lengths mm,
+        # interpolated in between and held beyond the ends. Limits are in field mm like the mark
+        # and jump speeds. Jumps no longer than short_jump mm stay plain moves at the jump speed.
+        self.max_velocity = max_velocity
+        self.acceleration = acceleration
+        self.settle_lengths = np.asarray(settle_lengths, dtype=np.float64)
+        self.settle_times = np.asarray(settle_times, dtype=np.float64)
+        self.short_jump = short_jump
+
+        if max_velocity <= 0 or acceleration <= 0:
+            raise ValueError("Jump velocity and acceleration must be positive.")
+        if (self.settle_lengths.ndim != 1 or not len(self.settle_lengths)
+                or self.settle_lengths.shape != self.settle_times.shape):
+            raise ValueError("settle_lengths and settle_times need one settle time per jump length.")
+        if np.any(np.diff(self.settle_lengths) <= 0) or np.any(self.settle_times < 0):
+            raise ValueError("Settle lengths must be increasing and settle times not negative.")
+        if short_jump < 0:
+            raise ValueError("short_jump must not be negative.")
+
+    def _profile(self, lengths):
+        # Peak velocity, time to reach it and time in motion per jump; jumps too short to reach
+        # max_velocity turn round halfway
+        peak = np.minimum(self.max_velocity, np.sqrt(lengths * self.acceleration))
+        ramp = peak / self.acceleration
+        motion = np.divide(lengths, peak, out=np.zeros_like(peak), where=peak > 0) + ramp
+        return peak, ramp, motion
+
+    def settle_time(self, lengths):
+        return np.interp(lengths, self.settle_lengths, self.settle_times)
+
+    def jump_times(self, lengths):
+        # Shortest safe time of jumps of the given lengths in mm: motion and settling, in seconds
+        lengths = np.asarray(lengths, dtype=np.float64)
+        return self._profile(lengths)[2] + self.settle_time(lengths)
+
+    def travelled(self, lengths, times):
+        # Distance covered times seconds into jumps of the given lengths, both arrays of equal
+        # length; the full length once the beam is settling
+        peak, ramp, motion = self._profile(lengths)
+        times = np.minimum(times, motion)
+        half_acceleration = 0.5 * self.acceleration
+        return np.where(times < ramp, half_acceleration * times ** 2,
+                        np.where(times < motion - ramp, half_acceleration * ramp ** 2 + peak * (times - ramp),
+                                 lengths - half_acceleration * (motion - times) ** 2))
+
 
 class LaserPathPlanning:
     
-    def __init__(self, x_coords, y_coords, laser_distance, intrp_mode='linear', min_angle=-12.5, max_angle=12.5, voltage_min=-15, voltage_max=15, dac_res=4096, galvo_kpps=20000):
+    def __init__(self, x_coords, y_coords, laser_distance, intrp_mode='linear', min_angle=-12.5, max_angle=12.5, voltage_min=-15, voltage_max=15, dac_res=4096, galvo_kpps=20000, correction=None, mark_speed=DEFAULT_MARK_SPEED, jump_speed=DEFAULT_JUMP_SPEED, laser_on=None, jump_planner=None):
         self.X_Coords = x_coords
         self.Y_Coords = y_coords
         self.Laser_Distance = laser_distance
@@ -16,10 +191,41 @@ class LaserPathPlanning:
         self.voltage_max = voltage_max   # Maximum voltage in volts
         self.dac_resolution = dac_res  # DAC resolution (12-bit)
         self.galvo_kpps = galvo_kpps    # Galvo points per second
+        # Optional FieldCorrection grid; when set it replaces the ideal angle model below
+        self.correction = correction
+        # Beam speeds in mm/s and per point laser state (None: all marks) for get_resampled_path
+        self.mark_speed = mark_speed
+        self.jump_speed = jump_speed
+        self.laser_on = laser_on
+        # Optional JumpPlanner for acceleration-limited jumps with settling in the resampled path
+        self.jump_planner = jump_planner
         self.dac_values_x = []
         self.dac_values_y = []
-        self.smooth_dac_value_x = []
-        self.smooth_dac_value_y = []
+        self.smooth_dac_values_x = []
+        self.smooth_dac_values_y = []
+        # Coordinate buffers that extend appends to, and the views of them handed out as X_Coords
+        # and Y_Coords
+        self._x_buffer = self._y_buffer = None
+        self._x_view = self._y_view = None
+        self._on_buffer = self._on_view = None
+    
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in TRANSFORM_FIELDS:
+            self._reset()
+        elif name in SMOOTH_FIELDS:
+            self._smooth_count = None
+        elif name in RESAMPLE_FIELDS:
+            self._resampled = None
+    
+    def _reset(self):
+        # Drops the converted DAC values; the next conversion starts from the first point
+        self._dac_x = np.empty(0)
+        self._dac_y = np.empty(0)
+        self._converted = 0
+        self._smooth_count = None
+        self._resampled = None
+        self._resampled_dac = None
         
     def _cartesian_to_theta(self, x, y):
         theta_x = np.arctan2(x, self.Laser_Distance)  # X-axis
@@ -42,7 +248,7 @@ class LaserPathPlanning:
         
         return dac_value
     
-    # Interpolation function
+    # Interpolation function: evenly spaced in point index, not in time; see get_resampled_path
     def _interpolate_points(self, x, y, num_points):
         t = np.linspace(0, 1, len(x))
         t_new = np.linspace(0, 1, num_points)
@@ -52,35 +258,79 @@ class LaserPathPlanning:
         y_new = interp_y(t_new)
         return x_new, y_new
     
-    def coords_to_dac(self):
-        
-        # Use tqdm to show progress in the terminal
-        for x_coord, y_coord in tqdm(zip(self.X_Coords, self.Y_Coords), total=len(self.X_Coords), desc="Converting coordinates to DAC values"):
-            
-            theta_x, theta_y = self._cartesian_to_theta(x_coord, y_coord)
+    def _transform(self, x_coords, y_coords):
+        # Every point goes through the angle, galvo range and DAC mapping as one array operation
+        if self.correction is not None:
+            return self.correction.apply(x_coords, y_coords)
+        theta_x, theta_y = self._cartesian_to_theta(x_coords, y_coords)
+        return self._theta_to_dac(theta_x), self._theta_to_dac(theta_y)
+    
+    def _convert(self):
+        # Converts the points not converted yet and returns the point count. Like pairing the
+        # coordinates up, it stops at the shorter of the two. Points edited in place are not
+        # noticed; assign new coordinates or use extend instead.
+        count = min(len(self.X_Coords), len(self.Y_Coords))
+        if count < self._converted:
+            self._reset()
+        if count > self._converted:
+            x_coords = np.asarray(self.X_Coords[self._converted:count])
+            y_coords = np.asarray(self.Y_Coords[self._converted:count])
+            dac_x, dac_y = self._transform(x_coords, y_coords)
+            self._dac_x = _append(self._dac_x, self._converted, dac_x)
+            self._dac_y = _append(self._dac_y, self._converted, dac_y)
+            self._converted = count
+        self.dac_values_x = self._dac_x[:count]
+        self.dac_values_y = self._dac_y[:count]
         
-            # Print theta values for debugging
-            #print(f"Point: ({x_coord}, {y_coord}) -> Theta: ({theta_x}, {theta_y})")
-            
-            dac_value_x = self._theta_to_dac(theta_x)
-            dac_value_y = self._theta_to_dac(theta_y)
-            
-            # Print DAC values for debugging
-            #print(f"Theta: ({theta_x}, {theta_y}) -> DAC: ({dac_value_x}, {dac_value_y})")
-            
-            self.dac_values_x.append(dac_value_x)
-            self.dac_values_y.append(dac_value_y)
-            
         # Ensure DAC values are not empty
-        if not self.dac_values_x or not self.dac_values_y:
+        if not count:
             raise ValueError("DAC values are empty. Check the G-code parsing and conversion functions.")
-        
-        # Interpolate the DAC values to get a smoother curve
-        num_interpolated_points = 1 * len(self.dac_values_x)  # Adjust the factor as needed
-        self.smooth_dac_values_x, self.smooth_dac_values_y = self._interpolate_points(self.dac_values_x, self.dac_values_y, num_interpolated_points)
+        return count
+    
+    def extend(self, x_coords, y_coords, laser_on=None):
+        # Appends points to the job and converts only those; earlier points keep their DAC values.
+        # Without laser_on the new points are marks.
+        x_coords = np.asarray(x_coords, dtype=np.float64).ravel()
+        y_coords = np.asarray(y_coords, dtype=np.float64).ravel()
+        if len(x_coords) != len(y_coords):
+            raise ValueError("x_coords and y_coords must have the same length.")
+        count = min(len(self.X_Coords), len(self.Y_Coords))
+        if laser_on is not None or self.laser_on is not None:
+            laser_on = np.ones(len(x_coords), dtype=bool) if laser_on is None else np.asarray(laser_on, dtype=bool).ravel()
+            if len(laser_on) != len(x_coords):
+                raise ValueError("laser_on needs one state per point.")
+            if self.laser_on is None or self.laser_on is not self._on_view:
+                states = np.ones(count, dtype=bool) if self.laser_on is None else self.laser_on[:count]
+                self._on_buffer = np.array(states, dtype=bool)
+            self._on_buffer = _append(self._on_buffer, count, laser_on)
+            self._on_view = self._on_buffer[:count + len(laser_on)]
+            self.laser_on = self._on_view
+        if self.X_Coords is not self._x_view or self.Y_Coords is not self._y_view:
+            # Take the coordinates over into buffers that later calls append to in place
+            self._x_buffer = np.array(self.X_Coords[:count], dtype=np.float64)
+            self._y_buffer = np.array(self.Y_Coords[:count], dtype=np.float64)
+        self._x_buffer = _append(self._x_buffer, count, x_coords)
+        self._y_buffer = _append(self._y_buffer, count, y_coords)
+        # The points already there are unchanged, so the views bypass the reset in __setattr__
+        self._x_view = self._x_buffer[:count + len(x_coords)]
+        self._y_view = self._y_buffer[:count + len(y_coords)]
+        object.__setattr__(self, 'X_Coords', self._x_view)
+        object.__setattr__(self, 'Y_Coords', self._y_view)
+        if len(self._x_view):
+            self._convert()
+    
+    def coords_to_dac(self):
+        # DAC values of all points and their smoothed curve, kept until the coordinates or
+        # galvo parameters change
+        count = self._convert()
+        if self._smooth_count != count:
+            # Interpolate the DAC values to get a smoother curve
+            num_interpolated_points = 1 * count  # Adjust the factor as needed
+            self.smooth_dac_values_x, self.smooth_dac_values_y = self._interpolate_points(self.dac_values_x, self.dac_values_y, num_interpolated_points)
+            self._smooth_count = count
 
     def get_dac_values(self):
-        self.coords_to_dac()
+        self._convert()
         dac_x = np.round(self.dac_values_x).astype(int)
         dac_y = np.round(self.dac_values_y).astype(int)
         return dac_x, dac_y
@@ -90,3 +340,93 @@ class LaserPathPlanning:
         smooth_x = np.round(self.smooth_dac_values_x).astype(int)
         smooth_y = np.round(self.smooth_dac_values_y).astype(int)
         return smooth_x, smooth_y
+    
+    def get_resampled_path(self):
+        # Path in mm as the galvo plays it: one point per galvo tick at galvo_kpps points per
+        # second, at mark_speed where the laser is on and jump_speed elsewhere. Returns x, y and
+        # laser state per point.
+        count = min(len(self.X_Coords), len(self.Y_Coords))
+        if self._resampled is None or self._resampled[0] != count:
+            path = resample_path(self.X_Coords[:count], self.Y_Coords[:count], self.laser_on,
+                                 self.mark_speed, self.jump_speed, self.galvo_kpps, self.jump_planner)
+            self._resampled = (count, path)
+        return self._resampled[1]
+    
+    def get_resampled_dac_values(self):
+        # DAC values and laser state of get_resampled_path
+        x_coords, y_coords, laser_on = self.get_resampled_path()
+        if self._resampled_dac is None or self._resampled_dac[0] is not x_coords:
+            if not len(x_coords):
+                raise ValueError("DAC values are empty. Check the G-code parsing and conversion functions.")
+            dac_x, dac_y = self._transform(x_coords, y_coords)
+            self._resampled_dac = (x_coords, np.round(dac_x).astype(int), np.round(dac_y).astype(int))
+        return self._resampled_dac[1], self._resampled_dac[2], laser_on
+    
+    def _dac_samples(self, x_coords, y_coords, laser_on, dtype, offset):
+        # Resampled points as DAC samples, clamped to the DAC range
+        dac_x, dac_y = self._transform(x_coords, y_coords)
+        samples = np.empty(len(x_coords), dtype=sample_dtype(dtype))
+        for field, values in (('x', dac_x), ('y', dac_y)):
+            values = np.clip(np.round(values), 0, self.dac_resolution - 1)
+            samples[field] = values - offset
+        samples['laser_on'] = laser_on
+        return samples
+    
+    def _stream_samples(self, chunks, dtype, offset):
+        # Resamples the chunks as one continuous path: the last point of a chunk starts the
+        # next one and the galvo ticks keep their spacing across the joint
+        tick = 1.0 / self.galvo_kpps
+        previous = None  # last point so far: x, y and laser state
+        last_path = None  # points and segments of the last chunk, for the end of the path
+        next_tick = 0.0  # time of the next tick, counted from the previous point
+        for chunk in chunks:
+            if getattr(chunk, 'dtype', None) is not None and chunk.dtype.names:
+                laser_on = chunk['laser_on'] if 'laser_on' in chunk.dtype.names else None
+                x_coords, y_coords, laser_on = _path_arrays(chunk['x'], chunk['y'], laser_on)
+            else:
+                x_coords, y_coords, laser_on = _path_arrays(*chunk)
+            if not len(x_coords):
+                continue
+            if previous is not None:
+                x_coords = np.concatenate(([previous[0]], x_coords))
+                y_coords = np.concatenate(([previous[1]], y_coords))
+                laser_on = np.concatenate(([previous[2]], laser_on))
+            previous = (x_coords[-1], y_coords[-1], laser_on[-1])
+            if len(x_coords) < 2:
+                continue
+
+            segments = _segment_times(x_coords, y_coords, laser_on, self.mark_speed, self.jump_speed,
+                                      self.jump_planner)
+            total = segments[-1][-1]
+            ticks = int((total - next_tick) * self.galvo_kpps) + 1 if total >= next_tick else 0
+            times = next_tick + np.arange(ticks) * tick
+            next_tick = (times[-1] + tick if ticks else next_tick) - total
+            last_path = (x_coords, y_coords, segments, total)
+            if ticks:
+                yield self._dac_samples(*_positions_at(x_coords, y_coords, segments, times, self.jump_planner),
+                                        dtype, offset)
+
+        # Like resample_path the end of the path is always played; a single point is the path
+        if last_path is not None:
+            x_coords, y_coords, segments, total = last_path
+            if next_tick < tick * (1 - 1e-9):
+                end = _positions_at(x_coords, y_coords, segments, np.array([total]), self.jump_planner)
+                yield self._dac_samples(*end, dtype, offset)
+        elif previous is not None:
+            yield self._dac_samples(*(np.array([value]) for value in previous), dtype, offset)
+    
+    def iter_dac_samples(self, chunks, block_size=4096, dtype=np.uint16):
+        # Streams a job of any length. chunks are coordinate blocks from any source: arrays with
+        # x, y and optionally laser_on fields, like GcodeReader.iter_chunks yields, or (x, y) and
+        # (x, y, laser_on) tuples. They are resampled like get_resampled_path, converted like
+        # the DAC values and yielded as sample_dtype(dtype) blocks of block_size samples (the last
+        # may be shorter), so memory stays bounded by the chunk and block sizes. uint16 samples
+        # are DAC codes, int16 samples are centred on the middle of the DAC range.
+        dtype = np.dtype(dtype)
+        if dtype not in (np.dtype(np.uint16), np.dtype(np.int16)):
+            raise ValueError("DAC samples are int16 or uint16.")
+        if block_size <= 0:
+            raise ValueError("block_size must be positive.")
+        _check_rates(self.mark_speed, self.jump_speed, self.galvo_kpps)
+        offset = self.dac_resolution // 2 if dtype == np.int16 else 0
+        return _rebatch(self._stream_samples(chunks, dtype, offset), block_size, sample_dtype(dtype))
@@ -17,10 +17,11 @@ class LaserPathVisual:
         
         if self.mode == "raster":
             self._raster_visual()
-        elif self.mode == "vector":
+        elif self.mode in ("vector", "span"):
+            # Span jobs are drawn as the path of their run ends, like vector contours
             self._vector_visual()
         else:
-            raise ValueError("Unsupported mode. Use 'raster' or 'vector'.")
+            raise ValueError("Unsupported mode. Use 'raster', 'span' or 'vector'.")
         
         
     def _vector_visual(self):
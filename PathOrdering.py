@@ -0,0 +1,172 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Candidate neighbours examined per point during 2-opt refinement
+TWO_OPT_NEIGHBOURS = 10
+
+
+class PathOrdering:
+
+    def __init__(self, paths, start=(0.0, 0.0), two_opt_passes=10, groups=None):
+        # paths are closed polylines (N x 2 arrays) whose closing edge is implied,
+        # so any vertex can serve as the entry point and the path ends where it began.
+        # groups optionally labels every path; paths with the same label are visited
+        # one after another, e.g. an outline and the contours nested in it
+        self.paths = [np.asarray(path, dtype=np.float64).reshape(-1, 2) for path in paths]
+        self.groups = None if groups is None else np.asarray(groups)
+        self.start = np.asarray(start, dtype=np.float64)
+        self.two_opt_passes = two_opt_passes
+        self.order = []
+        self.entry = []
+        self.jump_length_before = self._original_jump_length()
+        self.jump_length_after = 0.0
+
+        if self.paths:
+            self._plan()
+
+    def _original_jump_length(self):
+        # Jumps between consecutive paths as written: last vertex to the next first vertex
+        if len(self.paths) < 2:
+            return 0.0
+        ends = np.array([path[-1] for path in self.paths[:-1]])
+        starts = np.array([path[0] for path in self.paths[1:]])
+        return float(np.hypot(*(starts - ends).T).sum())
+
+    def _nearest_neighbour(self):
+        # Greedy tour: from the current position jump to the nearest vertex of any unvisited path
+        lengths = np.array([len(path) for path in self.paths])
+        offsets = np.cumsum(lengths) - lengths
+        points = np.vstack(self.paths)
+        owner = np.repeat(np.arange(len(self.paths)), lengths)
+
+        visited = np.zeros(len(self.paths), dtype=bool)
+        alive = np.arange(len(points))
+        tree = cKDTree(points)
+        dead = 0
+        position = self.start
+        order, entry = [], []
+        for _ in range(len(self.paths)):
+            # A group that has been entered is finished before any other path is visited
+            pending = None
+            if self.groups is not None and order:
+                pending = np.flatnonzero((self.groups == self.groups[order[-1]]) & ~visited)
+            if pending is not None and len(pending):
+                vertices = np.concatenate([offsets[path] + np.arange(lengths[path]) for path in pending])
+                vertex = vertices[np.argmin(np.hypot(*(points[vertices] - position).T))]
+            else:
+                vertex = self._nearest_unvisited(tree, alive, visited, owner, position)
+            path = owner[vertex]
+            visited[path] = True
+            order.append(int(path))
+            entry.append(int(vertex - offsets[path]))
+            position = points[vertex]
+
+            # Rebuild the index once visited vertices make up most of it
+            dead += lengths[path]
+            if dead * 2 > len(alive) and not visited.all():
+                alive = alive[~visited[owner[alive]]]
+                tree = cKDTree(points[alive])
+                dead = 0
+        return order, entry
+
+    @staticmethod
+    def _nearest_unvisited(tree, alive, visited, owner, position):
+        # Nearest vertex of any unvisited path, widening the search until one turns up
+        k = 8
+        while True:
+            k = min(k, len(alive))
+            _, found = tree.query(position, k=k)
+            candidates = alive[np.atleast_1d(found)]
+            unvisited = ~visited[owner[candidates]]
+            if unvisited.any() or k == len(alive):
+                break
+            k *= 4
+        return candidates[np.argmax(unvisited)]
+
+    def _move_gains(self, points, route, position, neighbours, i, labels=None):
+        # Length saved by reversing route[i:j + 1] for every neighbour-list candidate j
+        # of the route point before i; rows of i are scored together when i is an array.
+        # With group labels per point only reversals that keep every group contiguous
+        # score: within one group, or starting and ending on group boundaries.
+        count = len(route)
+        candidates = position[neighbours[route[i - 1]]]
+        a = points[route[i - 1]][..., None, :]
+        b = points[route[i]][..., None, :]
+        c = points[route[candidates]]
+        has_next = candidates + 1 < count
+        d = points[route[np.minimum(candidates + 1, count - 1)]]
+        removed = np.linalg.norm(b - a, axis=-1) + np.where(has_next, np.linalg.norm(d - c, axis=-1), 0.0)
+        added = np.linalg.norm(c - a, axis=-1) + np.where(has_next, np.linalg.norm(d - b, axis=-1), 0.0)
+        allowed = candidates > np.asarray(i)[..., None]
+        if labels is not None:
+            first = labels[route[i]][..., None]
+            boundary = (labels[route[i - 1]][..., None] != first) & \
+                (~has_next | (labels[route[candidates]] != labels[route[np.minimum(candidates + 1, count - 1)]]))
+            allowed &= (labels[route[candidates]] == first) | boundary
+        gain = np.where(allowed, removed - added, 0.0)
+        return candidates, gain
+
+    def _two_opt(self, points, labels=None):
+        # Reverse route segments while that shortens the open route through points;
+        # points[0] is the fixed start position. Candidate moves come from
+        # nearest-neighbour lists, and each pass scores every route position at
+        # once so only positions with an improving move are revisited one by one.
+        count = len(points)
+        route = np.arange(count)
+        if count < 4:
+            return route
+        _, neighbours = cKDTree(points).query(points, k=min(TWO_OPT_NEIGHBOURS + 1, count))
+
+        for _ in range(self.two_opt_passes):
+            position = np.empty(count, dtype=np.int64)
+            position[route] = np.arange(count)
+            _, gain = self._move_gains(points, route, position, neighbours, np.arange(1, count), labels)
+            improving = np.flatnonzero(gain.max(axis=1) > 1e-9) + 1
+            if not improving.size:
+                break
+            for i in improving.tolist():
+                candidates, gain = self._move_gains(points, route, position, neighbours, i, labels)
+                best = np.argmax(gain)
+                if gain[best] > 1e-9:
+                    j = candidates[best]
+                    route[i:j + 1] = route[i:j + 1][::-1].copy()
+                    position[route[i:j + 1]] = np.arange(i, j + 1)
+        return route
+
+    def _refine_entries(self):
+        # Move each entry to the vertex that best connects the previous and next entry points
+        position = self.start
+        for k, path in enumerate(self.order):
+            vertices = self.paths[path]
+            cost = np.hypot(*(vertices - position).T)
+            if k + 1 < len(self.order):
+                following = self.paths[self.order[k + 1]][self.entry[k + 1]]
+                cost = cost + np.hypot(*(vertices - following).T)
+            self.entry[k] = int(np.argmin(cost))
+            position = vertices[self.entry[k]]
+
+    def _plan(self):
+        order, entry = self._nearest_neighbour()
+
+        entry_points = np.array([self.paths[path][vertex] for path, vertex in zip(order, entry)])
+        labels = None
+        if self.groups is not None:
+            # Group numbers along the nearest-neighbour tour, the start point in a group of its own
+            _, labels = np.unique(self.groups[order], return_inverse=True)
+            labels = np.concatenate(([-1], labels.ravel()))
+        route = self._two_opt(np.vstack((self.start, entry_points)), labels)[1:] - 1
+        self.order = [order[k] for k in route]
+        self.entry = [entry[k] for k in route]
+        self._refine_entries()
+
+        if len(self.order) > 1:
+            entry_points = np.array([self.paths[path][vertex] for path, vertex in zip(self.order, self.entry)])
+            self.jump_length_after = float(np.hypot(*np.diff(entry_points, axis=0).T).sum())
+
+    def get_ordered_paths(self):
+        # Paths in planned order, each rotated to start at its entry vertex and closed back onto it
+        ordered = []
+        for path, vertex in zip(self.order, self.entry):
+            rotated = np.roll(self.paths[path], -vertex, axis=0)
+            ordered.append(np.vstack((rotated, rotated[:1])))
+        return ordered
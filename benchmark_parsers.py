@@ -0,0 +1,250 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage; peak RSS is reported as None there
+    resource = None
+
+# Bump when the meaning of a result field changes so old result files are not compared blindly
+RESULTS_VERSION = 1
+# Distance between neighbouring pixels of the raster files, in mm
+PIXEL_PITCH = 0.1
+# Default file sizes: raster width x height in pixels, vector contours x points per contour
+RASTER_SIZES = ("250x250", "1000x1000")
+VECTOR_SIZES = ("100x100", "1000x200")
+PARSERS = ("GcodeClass", "gcodeparserclass", "galvo")
+
+
+def _raster_gcode(width, height, direction, seed=0):
+    # Raster file in the layout ImageToGcode writes: one G01 line per pixel with its laser
+    # switch and power, and in uni-directional mode a laser-off move to the next row at the
+    # end of every row but the last. About half the pixels are lit, drawn from a fixed seed.
+    rng = np.random.default_rng(seed)
+    lit = rng.random((height, width)) < 0.5
+    x_texts = np.array([f"G01 X{x * PIXEL_PITCH:.6f} Y" for x in range(width)], dtype=object)
+    y_texts = [f"{y * PIXEL_PITCH:.6f} " for y in range(height)]
+    tails = np.array(["M5 S00\n", "M3 S255\n"], dtype=object)
+    lines = ["raster\n"]
+    for y in range(height):
+        columns = np.arange(width)
+        if direction == "bi" and y % 2:
+            columns = columns[::-1]
+        lines += (x_texts[columns] + y_texts[y] + tails[lit[y, columns].astype(np.int64)]).tolist()
+        if direction == "uni" and y + 1 < height:
+            lines.append(f"G1 X{columns[-1] * PIXEL_PITCH:.6f} Y{(y + 1) * PIXEL_PITCH:.6f} M5 S00\n")
+    return "".join(lines)
+
+
+def _vector_gcode(contours, points, seed=0):
+    # Vector file in the layout ImageToGcode writes: a 'vector' header and one G01 line per
+    # contour point. Contours are closed wobbly rings of the given point count at random places.
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    lines = ["vector\n"]
+    for _ in range(contours):
+        centre = rng.uniform(10, 90, 2)
+        radius = rng.uniform(1, 10) * (1 + 0.1 * np.sin(angles * rng.integers(2, 9)))
+        xs = centre[0] + radius * np.cos(angles)
+        ys = centre[1] + radius * np.sin(angles)
+        lines += [f"G01 X{x:.6f} Y{y:.6f}\n" for x, y in zip(xs.tolist(), ys.tolist())]
+    return "".join(lines)
+
+
+def _size(text):
+    width, height = (int(part) for part in text.lower().split("x"))
+    return width, height
+
+
+def generate_files(directory, raster_sizes=RASTER_SIZES, vector_sizes=VECTOR_SIZES):
+    # Writes the benchmark inputs into directory; returns their descriptions
+    files = []
+    for text in raster_sizes:
+        width, height = _size(text)
+        for direction in ("uni", "bi"):
+            name = f"raster_{direction}_{width}x{height}.gcode"
+            files.append(_write_file(directory, name, _raster_gcode(width, height, direction),
+                                     kind="raster", direction=direction, width=width, height=height))
+    for text in vector_sizes:
+        contours, points = _size(text)
+        name = f"vector_{contours}x{points}.gcode"
+        files.append(_write_file(directory, name, _vector_gcode(contours, points),
+                                 kind="vector", contours=contours, points=points))
+    return files
+
+
+def _write_file(directory, name, text, **description):
+    path = os.path.join(directory, name)
+    with open(path, 'w', newline='') as f:
+        f.write(text)
+    return dict(description, name=name, path=path, bytes=os.path.getsize(path), lines=text.count("\n"))
+
+
+def _parse_gcodeclass(path):
+    from GcodeClass import GcodeParser
+    return len(GcodeParser(path).get_x_coords())
+
+
+def _first_point_gcodeclass(path):
+    from GcodeClass import GcodeReader
+    next(GcodeReader(path).iter_chunks(1), None)
+
+
+def _parse_gcodeparserclass(path):
+    from gcodeparserclass import GCodeParser
+    parser = GCodeParser(path)
+    parser.parse()
+    return len(parser.commands)
+
+
+def _parse_galvo(path):
+    from galvo import parse_gcode
+    return len(parse_gcode(path)[0])
+
+
+# Per parser: its module, the full parse returning the number of points (or commands) it
+# produced, and how to get just the first point. Parsers without a streaming interface deliver
+# their first point only once the whole file is parsed, so time to first point is the parse time.
+PARSER_RUNS = {
+    "GcodeClass": ("GcodeClass", _parse_gcodeclass, _first_point_gcodeclass),
+    "gcodeparserclass": ("gcodeparserclass", _parse_gcodeparserclass, None),
+    "galvo": ("galvo", _parse_galvo, None),
+}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def _measure(parser, path, repeat):
+    # Runs in a fresh process so the peak RSS belongs to this parser and file alone
+    module, parse, first_point = PARSER_RUNS[parser]
+    try:
+        # Imported up front so import time and memory are not counted as parsing
+        importlib.import_module(module)
+    except ImportError as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+    rss_before = _peak_rss_mb()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        points = parse(path)
+        times.append(time.perf_counter() - start)
+    first_times = []
+    if first_point is not None:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            first_point(path)
+            first_times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "first_point_seconds": min(first_times or times), "points": points,
+            "rss_before_mb": rss_before, "peak_rss_mb": _peak_rss_mb()}
+
+
+def run_benchmarks(files, parsers=PARSERS, repeat=3):
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for description in files:
+        for parser in parsers:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(_measure, parser, description['path'], repeat).result()
+            entry = {"parser": parser, "file": description['name']}
+            entry.update({key: value for key, value in description.items() if key not in ("name", "path")})
+            entry.update(result)
+            if "seconds" in result:
+                entry["lines_per_second"] = description['lines'] / result['seconds']
+                entry["mb_per_second"] = description['bytes'] / (1 << 20) / result['seconds']
+            results.append(entry)
+            _print_entry(entry)
+    return results
+
+
+def _print_entry(entry):
+    if "error" in entry:
+        print(f"{entry['parser']:>16} {entry['file']:<28} skipped: {entry['error']}")
+        return
+    rss = "n/a" if entry['peak_rss_mb'] is None else f"{entry['peak_rss_mb']:.0f} MB"
+    print(f"{entry['parser']:>16} {entry['file']:<28} {entry['seconds']:8.3f} s "
+          f"{entry['lines_per_second'] / 1e6:7.2f} Mlines/s {entry['mb_per_second']:7.1f} MB/s "
+          f"first point {entry['first_point_seconds']:8.4f} s  peak RSS {rss}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    # Parse time of every parser and file against an earlier results file
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != RESULTS_VERSION:
+        print(f"{baseline_path} has results version {baseline.get('version')}, not {RESULTS_VERSION}.")
+        return
+    before = {(entry['parser'], entry['file']): entry for entry in baseline['results'] if "seconds" in entry}
+    print(f"Against {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    for entry in results:
+        old = before.get((entry['parser'], entry['file']))
+        if old is not None and "seconds" in entry:
+            print(f"{entry['parser']:>16} {entry['file']:<28} {old['seconds']:8.3f} s -> {entry['seconds']:8.3f} s "
+                  f"({old['seconds'] / entry['seconds']:.2f}x)")
+
+
+def main():
+    arguments = argparse.ArgumentParser(description="Benchmark the G-code parsers on synthetic files.")
+    arguments.add_argument("--raster", nargs="*", default=list(RASTER_SIZES), metavar="WxH",
+                           help="raster file sizes in pixels")
+    arguments.add_argument("--vector", nargs="*", default=list(VECTOR_SIZES), metavar="KxL",
+                           help="vector file sizes: contours x points per contour")
+    arguments.add_argument("--parsers", nargs="*", default=list(PARSERS), choices=PARSERS)
+    arguments.add_argument("--repeat", type=int, default=3, help="runs per measurement; the fastest counts")
+    arguments.add_argument("--output", default="parser_benchmark.json", help="JSON results file")
+    arguments.add_argument("--baseline", help="earlier JSON results file to compare against")
+    arguments.add_argument("--keep-files", metavar="DIR", help="write the generated files here and keep them")
+    options = arguments.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = options.keep_files or temp_dir
+        os.makedirs(directory, exist_ok=True)
+        files = generate_files(directory, options.raster, options.vector)
+        results = run_benchmarks(files, options.parsers, options.repeat)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "commit": _git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": options.repeat,
+        "results": results,
+    }
+    with open(options.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {options.output}")
+    if options.baseline:
+        compare(results, options.baseline)
+
+
+if __name__ == "__main__":
+    main()
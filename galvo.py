@@ -25,25 +25,26 @@ def parse_gcode(file_path):
     
     return x_coords, y_coords
 
-# Path to your G-code file
-gcode_file_path = 'C:\\Users\\a6260\\Downloads\\galvo\\venv\\assets\\texttogcode_line.gcode'
+if __name__ == "__main__":
+    # Path to your G-code file
+    gcode_file_path = 'C:\\Users\\a6260\\Downloads\\galvo\\venv\\assets\\texttogcode_line.gcode'
 
-# Parse the G-code file
-x_coords, y_coords = parse_gcode(gcode_file_path)
+    # Parse the G-code file
+    x_coords, y_coords = parse_gcode(gcode_file_path)
 
-# Set Z-coordinate to 0.0 for all points
-z_coords = [0.0] * len(x_coords)
+    # Set Z-coordinate to 0.0 for all points
+    z_coords = [0.0] * len(x_coords)
 
-# Plot the tool path in 3D
-fig = plt.figure(figsize=(10, 8))
-ax = fig.add_subplot(111, projection='3d')
+    # Plot the tool path in 3D
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111, projection='3d')
 
-ax.plot(x_coords, y_coords, z_coords, label='Tool Path', marker='o')
-ax.set_xlabel('X')
-ax.set_ylabel('Y')
-ax.set_zlabel('Z')
-ax.set_title('Tool Path (Z = 0.0 mm)')
-ax.legend()
+    ax.plot(x_coords, y_coords, z_coords, label='Tool Path', marker='o')
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_title('Tool Path (Z = 0.0 mm)')
+    ax.legend()
 
-plt.tight_layout()
-plt.show()
+    plt.tight_layout()
+    plt.show()
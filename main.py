@@ -1,5 +1,4 @@
 from Image_To_Gcode import ImageToGcode
-from GcodeClass import GcodeParser
 from LaserPathPlanning import LaserPathPlanning
 from LaserPathVisual import LaserPathVisual
 
@@ -20,15 +19,16 @@ def main():
     downsample_factor = 2
     
     print(f"Running ImageToGcode with mode={mode}")
-    ImageToGcode(image_path, output_gcode_path, downsample_factor, raster_dir, mode, scale, threshold, invert, scale_mode)
+    # No output file: the job stays in memory instead of a G-code round-trip.
+    # Pass output_gcode_path here and parse it with GcodeParser to keep a file.
+    converter = ImageToGcode(image_path, None, downsample_factor, raster_dir, mode, scale, threshold, invert, scale_mode)
     
-    print(f"Parsing G-code from {output_gcode_path}")
-    parser = GcodeParser(output_gcode_path)
-    frames = parser.get_frames()
-    x_coords = parser.get_x_coords()
-    y_coords = parser.get_y_coords()
-    #laser_state = parser.get_laser_state()
-    img_width, img_height = parser.get_image_dimensions()
+    job = converter.get_job()
+    frames = job.get_frames()
+    x_coords = job.get_x_coords()
+    y_coords = job.get_y_coords()
+    #laser_state = job.get_power()
+    img_width, img_height = job.get_image_dimensions()
     
     print(f"Dimensions: {img_width}x{img_height}")
     print(f"Number of frames: {len(frames)}")